@@ -0,0 +1,208 @@
+"""Headless batch feature extraction over a directory or manifest of images.
+
+Runs canny_edge_detection, harris_corner_detection and sift_feature_detection
+from feature_detection.py in a process pool and writes the results to disk.
+matplotlib is never imported on this path.
+
+    python batch_features.py photos/ --out features/ --workers 16
+    python batch_features.py manifest.txt --out features/ --steps canny,sift --skip-existing
+
+A manifest lists one image path per line (relative to the manifest's folder;
+lines starting with # are ignored). For each image <rel>/<name>.<ext>:
+
+    <out>/<rel>/<name>.<ext>.edges.png     Canny edge map (uint8, 0/255)
+    <out>/<rel>/<name>.<ext>.corners.npy   Harris corners: structured array x, y, response
+    <out>/<rel>/<name>.<ext>.sift.npz      keypoints (KEYPOINT_DTYPE) + descriptors (float32, N x 128)
+    <out>/summary.jsonl                    one line per image: counts, timing, errors
+
+Manifest entries whose outputs would land outside --out (e.g. ../x.jpg) fail
+and are reported in summary.jsonl.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import cv2
+import numpy as np
+
+from feature_detection import (canny_edge_detection, harris_corner_detection, keypoints_to_array,
+                               sift_feature_detection)
+from sift_cache import SiftCache
+
+IMAGE_EXTS = {'.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.webp'}
+STEPS = ('canny', 'harris', 'sift')
+CORNER_DTYPE = np.dtype([('x', '<f4'), ('y', '<f4'), ('response', '<f4')])
+
+_sift = None  # one detector per worker process
+_cache = None
+_opts = None
+
+
+def find_images(source):
+    """(path, path relative to the source) for a directory tree or a manifest file"""
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTS:
+                    path = os.path.join(root, name)
+                    yield path, os.path.relpath(path, source)
+        return
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                path = line if os.path.isabs(line) else os.path.join(base, line)
+                rel = os.path.relpath(path, base) if not os.path.isabs(line) else line.lstrip(os.sep)
+                yield path, rel
+
+
+def corner_points(harris_map, thresh_ratio):
+    """One point per above-threshold blob of the (dilated) Harris map"""
+    peak = float(harris_map.max()) if harris_map.size else 0.0
+    if peak <= 0:
+        return np.empty(0, dtype=CORNER_DTYPE)
+    mask = (harris_map > thresh_ratio * peak).astype(np.uint8)
+    n, _, _, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    centroids = centroids[1:]  # label 0 is the background
+    corners = np.empty(n - 1, dtype=CORNER_DTYPE)
+    corners['x'], corners['y'] = centroids[:, 0], centroids[:, 1]
+    ys = np.clip(np.rint(centroids[:, 1]).astype(int), 0, harris_map.shape[0] - 1)
+    xs = np.clip(np.rint(centroids[:, 0]).astype(int), 0, harris_map.shape[1] - 1)
+    corners['response'] = harris_map[ys, xs]
+    return corners
+
+
+def output_paths(out_dir, rel):
+    """Output files for an image, named after its full relative path so a.jpg and a.png don't collide"""
+    out_dir = os.path.realpath(out_dir)
+    base = os.path.realpath(os.path.join(out_dir, rel))
+    if os.path.commonpath([out_dir, base]) != out_dir:
+        raise ValueError(f'output path for {rel!r} is outside --out')
+    return {'canny': base + '.edges.png', 'harris': base + '.corners.npy', 'sift': base + '.sift.npz'}
+
+
+def _init_worker(opts):
+    global _sift, _cache, _opts
+    cv2.setNumThreads(1)  # parallelism comes from the pool; avoid oversubscribing cores
+    _opts = opts
+    if opts['sift_cache'] and 'sift' in opts['steps']:
+        _cache = SiftCache(opts['sift_cache'], max_bytes=opts['sift_cache_mb'] << 20)
+    if 'sift' in opts['steps']:
+        try:
+            _sift = cv2.SIFT_create()
+        except (cv2.error, AttributeError):
+            _sift = None
+
+
+def process_image(job):
+    path, rel = job
+    opts = _opts
+    result = {'path': path, 'ok': True}
+    t0 = time.perf_counter()
+    try:
+        paths = output_paths(opts['out'], rel)
+        if opts['skip_existing'] and all(os.path.exists(paths[s]) for s in opts['steps']):
+            result['skipped'] = True
+            return result
+        if _cache is not None:
+            with open(path, 'rb') as f:
+                data = f.read()  # hashed for the cache key, then decoded from memory
+            gray = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+        else:
+            gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)  # skips the BGR decode + cvtColor
+        if gray is None:
+            raise ValueError('could not read image')
+        result['shape'] = list(gray.shape)
+        os.makedirs(os.path.dirname(paths['canny']), exist_ok=True)
+
+        if 'canny' in opts['steps']:
+            edges = canny_edge_detection(gray, opts['canny_low'], opts['canny_high'])
+            cv2.imwrite(paths['canny'], edges)
+            result['edge_pixels'] = int(np.count_nonzero(edges))
+        if 'harris' in opts['steps']:
+            harris_map, _ = harris_corner_detection(gray, opts['block_size'], opts['ksize'], opts['k'], draw=False)
+            corners = corner_points(harris_map, opts['harris_thresh'])
+            np.save(paths['harris'], corners)
+            result['corners'] = int(len(corners))
+        if 'sift' in opts['steps']:
+            if _sift is None:
+                raise RuntimeError('SIFT is not available in this OpenCV build')
+            if _cache is not None:
+                keypoints, descriptors, result['sift_cache_hit'] = _cache.detect(data)
+            else:
+                keypoints, descriptors, _ = sift_feature_detection(gray, draw=False, sift=_sift)
+                keypoints = keypoints_to_array(keypoints or ())
+            if descriptors is None:
+                descriptors = np.empty((0, 128), dtype=np.float32)
+            np.savez(paths['sift'], keypoints=keypoints, descriptors=descriptors.astype(np.float32, copy=False))
+            result['keypoints'] = len(keypoints)
+    except Exception as e:
+        result.update(ok=False, error=f'{type(e).__name__}: {e}')
+    result['seconds'] = round(time.perf_counter() - t0, 4)
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Headless Canny/Harris/SIFT extraction over many images')
+    ap.add_argument('source', help='image directory (searched recursively) or manifest file')
+    ap.add_argument('--out', required=True, help='output directory')
+    ap.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    ap.add_argument('--steps', default=','.join(STEPS), help='comma-separated subset of canny,harris,sift')
+    ap.add_argument('--canny-low', type=float, default=50)
+    ap.add_argument('--canny-high', type=float, default=150)
+    ap.add_argument('--block-size', type=int, default=2, help='Harris neighbourhood size')
+    ap.add_argument('--ksize', type=int, default=3, help='Harris Sobel aperture')
+    ap.add_argument('--k', type=float, default=0.04, help='Harris free parameter')
+    ap.add_argument('--harris-thresh', type=float, default=0.01, help='corner threshold as a fraction of the max response')
+    ap.add_argument('--sift-cache', default=None, help='directory of a shared SIFT cache (see sift_cache.py)')
+    ap.add_argument('--sift-cache-mb', type=int, default=2048, help='SIFT cache size limit in MiB')
+    ap.add_argument('--skip-existing', action='store_true', help='skip images whose outputs already exist')
+    ap.add_argument('--chunksize', type=int, default=8, help='images handed to a worker at a time')
+    args = ap.parse_args()
+
+    steps = [s.strip() for s in args.steps.split(',') if s.strip()]
+    unknown = set(steps) - set(STEPS)
+    if unknown:
+        ap.error(f'unknown steps: {", ".join(sorted(unknown))}')
+    opts = {
+        'out': args.out, 'steps': steps, 'skip_existing': args.skip_existing,
+        'canny_low': args.canny_low, 'canny_high': args.canny_high,
+        'sift_cache': args.sift_cache, 'sift_cache_mb': args.sift_cache_mb,
+        'block_size': args.block_size, 'ksize': args.ksize, 'k': args.k, 'harris_thresh': args.harris_thresh,
+    }
+    os.makedirs(args.out, exist_ok=True)
+    jobs = list(find_images(args.source))
+    print(f'{len(jobs)} images, {args.workers} workers, steps: {",".join(steps)}')
+
+    done = failed = skipped = 0
+    t0 = time.perf_counter()
+    with open(os.path.join(args.out, 'summary.jsonl'), 'a') as summary, \
+            Pool(args.workers, initializer=_init_worker, initargs=(opts,)) as pool:
+        for result in pool.imap_unordered(process_image, jobs, chunksize=args.chunksize):
+            summary.write(json.dumps(result) + '\n')
+            if result.get('skipped'):
+                skipped += 1
+            elif result['ok']:
+                done += 1
+            else:
+                failed += 1
+                print(f"failed: {result['path']}: {result['error']}", file=sys.stderr)
+            n = done + failed + skipped
+            if n % 500 == 0:
+                rate = n / (time.perf_counter() - t0)
+                print(f'{n}/{len(jobs)} ({rate * 3600:,.0f} images/hour)', flush=True)
+
+    elapsed = max(time.perf_counter() - t0, 1e-9)
+    print(f'done: {done} processed, {skipped} skipped, {failed} failed in {elapsed:.1f}s '
+          f'({done / elapsed * 3600:,.0f} images/hour)')
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
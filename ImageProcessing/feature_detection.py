@@ -1,6 +1,9 @@
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
+
+# Compact on-disk form of cv2.KeyPoint (see keypoints_to_array)
+KEYPOINT_DTYPE = np.dtype([('x', '<f4'), ('y', '<f4'), ('size', '<f4'), ('angle', '<f4'),
+                           ('response', '<f4'), ('octave', '<i4'), ('class_id', '<i4')])
 
 def load_image(image_path):
     """Load image and convert to grayscale"""
@@ -44,14 +47,17 @@ def canny_edge_detection(gray_img, low_threshold=50, high_threshold=150):
     
     return edges
 
-def harris_corner_detection(gray_img, block_size=2, ksize=3, k=0.04):
-    """Detect corners using Harris corner detector"""
+def harris_corner_detection(gray_img, block_size=2, ksize=3, k=0.04, draw=True):
+    """Detect corners using Harris corner detector (draw=False skips the marked copy)"""
     # Harris corner detection
     harris_corners = cv2.cornerHarris(gray_img, block_size, ksize, k)
     
     # Dilate corner image to enhance corner points
     harris_corners = cv2.dilate(harris_corners, None)
     
+    if not draw:
+        return harris_corners, None
+    
     # Create a copy of original image to mark corners
     img_with_corners = cv2.cvtColor(gray_img, cv2.COLOR_GRAY2BGR)
     
@@ -60,15 +66,19 @@ def harris_corner_detection(gray_img, block_size=2, ksize=3, k=0.04):
     
     return harris_corners, img_with_corners
 
-def sift_feature_detection(gray_img):
-    """Detect and compute SIFT features"""
+def sift_feature_detection(gray_img, draw=True, sift=None):
+    """Detect and compute SIFT features (pass sift to reuse a detector; draw=False skips the drawing)"""
     try:
         # Create SIFT detector
-        sift = cv2.SIFT_create()
+        if sift is None:
+            sift = cv2.SIFT_create()
         
         # Detect keypoints and compute descriptors
         keypoints, descriptors = sift.detectAndCompute(gray_img, None)
         
+        if not draw:
+            return keypoints, descriptors, None
+        
         # Draw keypoints on the image
         img_with_keypoints = cv2.drawKeypoints(gray_img, keypoints, None, 
                                              flags=cv2.DRAW_MATCHES_FLAGS_DRAW_RICH_KEYPOINTS)
@@ -80,8 +90,23 @@ def sift_feature_detection(gray_img):
         print("SIFT may not be available in your OpenCV version.")
         return None, None, gray_img
 
+def keypoints_to_array(keypoints):
+    """cv2.KeyPoint list -> structured array (KEYPOINT_DTYPE), e.g. for np.save"""
+    arr = np.empty(len(keypoints), dtype=KEYPOINT_DTYPE)
+    for i, kp in enumerate(keypoints):
+        arr[i] = (kp.pt[0], kp.pt[1], kp.size, kp.angle, kp.response, kp.octave, kp.class_id)
+    return arr
+
+def array_to_keypoints(arr):
+    """Inverse of keypoints_to_array"""
+    return [cv2.KeyPoint(float(r['x']), float(r['y']), float(r['size']), float(r['angle']),
+                         float(r['response']), int(r['octave']), int(r['class_id'])) for r in arr]
+
 def display_results(original_img, gray_img, edges, harris_result, sift_result, keypoints):
     """Display all results in a subplot"""
+    # Imported here so the detection functions work headless (see batch_features.py)
+    import matplotlib.pyplot as plt
+    
     plt.figure(figsize=(15, 10))
     
     # Original image
@@ -0,0 +1,267 @@
+"""Bag-of-visual-words index for "which stored images look like this one?" queries.
+
+Build the index from the .sift.npz files that batch_features.py writes:
+
+    python batch_features.py photos/ --out features/ --steps sift
+    python image_index.py build features/ --index idx/ --vocab-size 4096
+    python image_index.py query query.jpg --index idx/ --top 10 --verify 20
+
+- Vocabulary: mini-batch k-means (NumPy) over descriptors sampled evenly
+  across the images.
+- Inverted file: for each visual word, the images containing it and the
+  term count, stored CSR-style (ptr / image ids / counts) in flat arrays.
+- Ranking: TF-IDF cosine similarity. A query only touches the posting
+  lists of the words it contains.
+- Verification (optional): only the top --verify candidates are re-ranked,
+  using ratio-test matches plus a RANSAC homography. The inlier count is
+  the new score.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from feature_detection import sift_feature_detection
+
+ASSIGN_CHUNK = 8192  # descriptors per distance matrix (chunk x vocab floats)
+
+
+def nearest_centers(x, centers, center_sq=None):
+    """Index of the closest center for every row of x (squared L2, via one matmul per chunk)"""
+    if center_sq is None:
+        center_sq = np.einsum('ij,ij->i', centers, centers)
+    out = np.empty(len(x), dtype=np.int32)
+    for i in range(0, len(x), ASSIGN_CHUNK):
+        chunk = np.asarray(x[i:i + ASSIGN_CHUNK], dtype=np.float32)
+        # |x|^2 is the same for every center, so it can be left out of the argmin
+        out[i:i + len(chunk)] = np.argmin(center_sq - 2.0 * chunk @ centers.T, axis=1)
+    return out
+
+
+def minibatch_kmeans(data, k, batch_size=4096, iters=200, seed=0, log=None):
+    """Sculley's mini-batch k-means: each center moves toward its batch mean with a per-center 1/count rate"""
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    if len(data) < k:
+        raise ValueError(f'need at least {k} descriptors, got {len(data)}')
+    centers = data[rng.choice(len(data), k, replace=False)].copy()
+    counts = np.zeros(k, dtype=np.float64)
+    for it in range(iters):
+        batch = data[rng.integers(0, len(data), batch_size)]
+        labels = nearest_centers(batch, centers)
+        order = np.argsort(labels, kind='stable')
+        labels, batch = labels[order], batch[order]
+        ids, starts, m = np.unique(labels, return_index=True, return_counts=True)
+        sums = np.add.reduceat(batch, starts, axis=0)
+        counts[ids] += m
+        rate = (m / counts[ids])[:, None].astype(np.float32)
+        centers[ids] += rate * (sums / m[:, None] - centers[ids])
+        # Re-seed centers that have never won a sample so the vocabulary stays full
+        if it and it % 20 == 0:
+            dead = np.flatnonzero(counts == 0)
+            if len(dead):
+                centers[dead] = data[rng.integers(0, len(data), len(dead))]
+        if log and (it + 1) % 50 == 0:
+            log(f'  k-means iteration {it + 1}/{iters}')
+    return centers
+
+
+class ImageIndex:
+    def __init__(self, vocab, ptr, images, counts, idf, norms, paths):
+        self.vocab = vocab.astype(np.float32, copy=False)
+        self.vocab_sq = np.einsum('ij,ij->i', self.vocab, self.vocab)
+        self.ptr, self.images, self.counts = ptr, images, counts
+        self.idf, self.norms, self.paths = idf, norms, paths
+
+    # --- build ---
+
+    @classmethod
+    def build(cls, feature_files, vocab_size=1024, sample=200_000, iters=200, seed=0, log=print):
+        rng = np.random.default_rng(seed)
+        per_image = max(1, -(-sample // max(1, len(feature_files))))
+        samples = []
+        for path in feature_files:
+            d = load_descriptors(path)
+            if len(d) > per_image:
+                d = d[rng.choice(len(d), per_image, replace=False)]
+            samples.append(d)
+        samples = np.concatenate(samples) if samples else np.empty((0, 128), np.float32)
+        log(f'vocabulary: {vocab_size} words from {len(samples)} sampled descriptors')
+        vocab = minibatch_kmeans(samples, vocab_size, iters=iters, seed=seed, log=log)
+        return cls.from_vocabulary(vocab, feature_files, log)
+
+    @classmethod
+    def from_vocabulary(cls, vocab, feature_files, log=print):
+        """Quantize every image against a fixed vocabulary and build the inverted file"""
+        vocab = vocab.astype(np.float32)
+        vocab_sq = np.einsum('ij,ij->i', vocab, vocab)
+        k = len(vocab)
+        all_words, all_images, all_counts = [], [], []
+        for image_id, path in enumerate(feature_files):
+            d = load_descriptors(path)
+            if len(d):
+                words, tf = np.unique(nearest_centers(d, vocab, vocab_sq), return_counts=True)
+                all_words.append(words)
+                all_images.append(np.full(len(words), image_id, dtype=np.int32))
+                all_counts.append(tf.astype(np.uint16 if tf.max() < 65536 else np.uint32))
+            if log and (image_id + 1) % 1000 == 0:
+                log(f'  quantized {image_id + 1}/{len(feature_files)} images')
+        words = np.concatenate(all_words) if all_words else np.empty(0, np.int32)
+        images = np.concatenate(all_images) if all_images else np.empty(0, np.int32)
+        counts = np.concatenate(all_counts).astype(np.uint32) if all_counts else np.empty(0, np.uint32)
+        # CSR layout: postings of word w are [ptr[w], ptr[w+1]) in images/counts
+        order = np.argsort(words, kind='stable')
+        images, counts = images[order], counts[order]
+        ptr = np.zeros(k + 1, dtype=np.int64)
+        np.cumsum(np.bincount(words, minlength=k), out=ptr[1:])
+        df = np.diff(ptr)
+        idf = np.log((len(feature_files) + 1) / (df + 1)).astype(np.float32)
+        weights = counts.astype(np.float32) * np.repeat(idf, df)
+        norms = np.sqrt(np.bincount(images, weights=weights ** 2, minlength=len(feature_files))).astype(np.float32)
+        return cls(vocab, ptr, images, counts, idf, norms, list(feature_files))
+
+    # --- persistence ---
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'vocab.npy'), self.vocab)
+        np.savez(os.path.join(directory, 'inverted.npz'), ptr=self.ptr, images=self.images,
+                 counts=self.counts, idf=self.idf, norms=self.norms)
+        with open(os.path.join(directory, 'images.json'), 'w') as f:
+            json.dump(self.paths, f)
+
+    @classmethod
+    def load(cls, directory):
+        vocab = np.load(os.path.join(directory, 'vocab.npy'))
+        inv = np.load(os.path.join(directory, 'inverted.npz'))
+        with open(os.path.join(directory, 'images.json')) as f:
+            paths = json.load(f)
+        return cls(vocab, inv['ptr'], inv['images'], inv['counts'], inv['idf'], inv['norms'], paths)
+
+    # --- query ---
+
+    def search(self, descriptors, top=10):
+        """[(image_id, cosine score)] best first, by TF-IDF over shared visual words"""
+        if descriptors is None or not len(descriptors):
+            return []
+        words, tf = np.unique(nearest_centers(descriptors, self.vocab, self.vocab_sq), return_counts=True)
+        q = tf.astype(np.float32) * self.idf[words]
+        q_norm = float(np.linalg.norm(q))
+        if q_norm == 0:
+            return []
+        starts, ends = self.ptr[words], self.ptr[words + 1]
+        lengths = ends - starts
+        if not lengths.sum():
+            return []
+        # Gather every posting of the query's words in one go
+        idx = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        contrib = np.repeat(q * self.idf[words], lengths) * self.counts[idx]
+        scores = np.bincount(self.images[idx], weights=contrib, minlength=len(self.paths))
+        hit = np.flatnonzero(scores)
+        scores = scores[hit] / (self.norms[hit] * q_norm)
+        best = np.argsort(-scores)[:top]
+        return [(int(hit[i]), float(scores[i])) for i in best]
+
+    def verify(self, keypoints, descriptors, candidates, ratio=0.75, min_matches=8):
+        """Re-rank candidates by RANSAC homography inliers: [(image_id, inliers, tfidf score)]"""
+        matcher = cv2.BFMatcher(cv2.NORM_L2)
+        q_xy = np.stack([keypoints['x'], keypoints['y']], axis=1).astype(np.float32)
+        q_desc = np.asarray(descriptors, dtype=np.float32)
+        out = []
+        for image_id, score in candidates:
+            data = np.load(self.paths[image_id])
+            c_kp, c_desc = data['keypoints'], data['descriptors'].astype(np.float32)
+            inliers = 0
+            if len(c_desc) >= 2 and len(q_desc) >= 2:
+                good = [m for m, n in matcher.knnMatch(q_desc, c_desc, k=2) if m.distance < ratio * n.distance]
+                if len(good) >= min_matches:
+                    src = q_xy[[m.queryIdx for m in good]]
+                    dst = np.stack([c_kp['x'], c_kp['y']], axis=1).astype(np.float32)[[m.trainIdx for m in good]]
+                    _, mask = cv2.findHomography(src, dst, cv2.RANSAC, 5.0)
+                    inliers = int(mask.sum()) if mask is not None else 0
+            out.append((image_id, inliers, score))
+        out.sort(key=lambda r: (-r[1], -r[2]))
+        return out
+
+
+def load_descriptors(path):
+    with np.load(path) as data:
+        return data['descriptors'].astype(np.float32, copy=False)
+
+
+def find_feature_files(directory):
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        found.extend(os.path.join(root, f) for f in sorted(files) if f.endswith('.sift.npz'))
+    return found
+
+
+def query_features(path):
+    """(keypoints structured array, descriptors) from a .sift.npz file or an image"""
+    from feature_detection import keypoints_to_array
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            return data['keypoints'], data['descriptors']
+    gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        raise SystemExit(f'could not read {path}')
+    keypoints, descriptors, _ = sift_feature_detection(gray, draw=False)
+    return keypoints_to_array(keypoints or ()), descriptors
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Bag-of-visual-words image index')
+    sub = ap.add_subparsers(dest='command', required=True)
+    b = sub.add_parser('build', help='build an index from batch_features.py output')
+    b.add_argument('features', help='directory containing .sift.npz files')
+    b.add_argument('--index', required=True, help='output directory for the index')
+    b.add_argument('--vocab-size', type=int, default=1024)
+    b.add_argument('--sample', type=int, default=200_000, help='descriptors sampled for the vocabulary')
+    b.add_argument('--iters', type=int, default=200, help='mini-batch k-means iterations')
+    b.add_argument('--vocab', default=None, help='reuse vocab.npy from an existing index instead of training')
+    q = sub.add_parser('query', help='rank indexed images against a query image')
+    q.add_argument('image', help='query image, or a .sift.npz feature file')
+    q.add_argument('--index', required=True)
+    q.add_argument('--top', type=int, default=10)
+    q.add_argument('--verify', type=int, default=0, help='geometrically verify the top N candidates (0 = off)')
+    args = ap.parse_args()
+
+    if args.command == 'build':
+        files = find_feature_files(args.features)
+        if not files:
+            raise SystemExit(f'no .sift.npz files under {args.features}')
+        t0 = time.perf_counter()
+        if args.vocab:
+            index = ImageIndex.from_vocabulary(np.load(args.vocab), files)
+        else:
+            index = ImageIndex.build(files, args.vocab_size, args.sample, args.iters)
+        index.save(args.index)
+        print(f'indexed {len(files)} images, {len(index.images)} postings in {time.perf_counter() - t0:.1f}s')
+        return
+
+    index = ImageIndex.load(args.index)
+    keypoints, descriptors = query_features(args.image)
+    t0 = time.perf_counter()
+    results = index.search(descriptors, max(args.top, args.verify))
+    search_ms = (time.perf_counter() - t0) * 1e3
+    if args.verify:
+        t0 = time.perf_counter()
+        verified = index.verify(keypoints, descriptors, results[:args.verify])
+        verify_ms = (time.perf_counter() - t0) * 1e3
+        print(f'search {search_ms:.1f} ms, verification of {len(verified)} candidates {verify_ms:.1f} ms')
+        for image_id, inliers, score in verified[:args.top]:
+            print(f'{inliers:5d} inliers  {score:.4f}  {index.paths[image_id]}')
+    else:
+        print(f'search {search_ms:.1f} ms')
+        for image_id, score in results[:args.top]:
+            print(f'{score:.4f}  {index.paths[image_id]}')
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,8 @@ import cv2
 import matplotlib.pyplot as plt
 import numpy as np
 
+from transforms import Affine, compose, warp
+
 def read_and_display_image(image_path):
     """Read and display an image using OpenCV and Matplotlib"""
     # Read image using OpenCV
@@ -23,24 +25,42 @@ def read_and_display_image(image_path):
     
     return img_bgr, img_rgb
 
-def perform_transformations(img):
-    """Perform rotation, scaling, and translation transformations"""
+def perform_transformations(img, batch=None):
+    """Perform rotation, scaling, and translation transformations
+    
+    Each output is one warpAffine (see transforms.py). Pass a WarpBatch to
+    reuse its destination buffers across calls, e.g. once per video frame.
+    """
     height, width = img.shape[:2]
     
     # Rotation (45 degrees)
     center = (width // 2, height // 2)
-    rotation_matrix = cv2.getRotationMatrix2D(center, 45, 1.0)
-    rotated = cv2.warpAffine(img, rotation_matrix, (width, height))
+    rotation = Affine.rotate(45, center)
     
-    # Scaling (0.7x)
-    scaled = cv2.resize(img, None, fx=0.7, fy=0.7, interpolation=cv2.INTER_LINEAR)
+    # Scaling (0.7x), sampled like cv2.resize
+    scaling = Affine.scale(0.7)
+    scaled_size = (int(round(width * 0.7)), int(round(height * 0.7)))
     
     # Translation (shift by 50 pixels right and 30 pixels down)
-    translation_matrix = np.float32([[1, 0, 50], [0, 1, 30]])
-    translated = cv2.warpAffine(img, translation_matrix, (width, height))
+    translation = Affine.translate(50, 30)
+    
+    transforms = [rotation, scaling, translation]
+    dsizes = [(width, height), scaled_size, (width, height)]
+    if batch is not None:
+        rotated, scaled, translated = batch.run(img, transforms, dsizes)
+    else:
+        rotated, scaled, translated = (warp(img, t, d) for t, d in zip(transforms, dsizes))
     
     return rotated, scaled, translated
 
+def perform_chained_transformation(img, angle=45, factor=0.7, shift=(50, 30)):
+    """Rotate, then scale, then translate in a single resampling pass"""
+    height, width = img.shape[:2]
+    chain = compose(Affine.rotate(angle, (width / 2, height / 2)),
+                    Affine.scale(factor),
+                    Affine.translate(*shift))
+    return warp(img, chain)
+
 def convert_color_spaces(img_bgr):
     """Convert image to grayscale and HSV color spaces"""
     # Convert to grayscale
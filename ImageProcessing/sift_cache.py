@@ -0,0 +1,254 @@
+"""Persistent SIFT keypoint/descriptor cache keyed by image content hash + detector parameters.
+
+Layout under the cache directory:
+
+    index.sqlite          key -> (shard, generation, offset, count, descriptor dtype), plus LRU times
+    shard_XX.<gen>.bin    append-only records; each is keypoints (KEYPOINT_DTYPE) and then descriptors
+
+Records are 16-byte aligned. A hit is an index lookup plus two views into
+the memory-mapped shard file, so no pixel decoding and no copy. SIFT
+descriptors are integers 0..255 stored as float32, so the uint8 default is
+lossless at a quarter of the size.
+
+Writers (put, eviction, compaction) run inside an IMMEDIATE sqlite
+transaction. That write lock also serializes appends to the shard files, so
+worker processes can share one cache. When the live data goes over
+max_bytes, least-recently-used entries are dropped. A shard that is mostly
+dead records is rewritten under a new generation, and the old file is
+deleted. Views a reader already holds stay valid, because its memory map
+keeps the old file alive. A get() that looked up the old generation just
+before the file was deleted finds the file gone, and re-reads the index.
+
+    cache = SiftCache("sift_cache", max_bytes=2 << 30)
+    keypoints, descriptors, hit = cache.detect("photo.jpg")
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import cv2
+import numpy as np
+
+from feature_detection import KEYPOINT_DTYPE, keypoints_to_array, sift_feature_detection
+
+ALIGN = 16
+DESCRIPTOR_DTYPES = ('uint8', 'float32')
+TOUCH_FLUSH = 256  # hits buffered before their access times are written to the index
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _as_stored(descriptors, descriptor_dtype):
+    if descriptor_dtype not in DESCRIPTOR_DTYPES:
+        raise ValueError(f'descriptor_dtype must be one of {DESCRIPTOR_DTYPES}')
+    if descriptors is None:
+        descriptors = np.empty((0, 128), dtype=np.float32)
+    if descriptor_dtype == 'uint8':
+        descriptors = np.clip(np.rint(descriptors), 0, 255)
+    return np.ascontiguousarray(descriptors, dtype=descriptor_dtype)
+
+
+class SiftCache:
+    def __init__(self, root, max_bytes=2 << 30, shards=16):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.shards = shards
+        os.makedirs(root, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(root, 'index.sqlite'), timeout=60, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, shard INTEGER, offset INTEGER, count INTEGER,
+                dtype TEXT, cols INTEGER, nbytes INTEGER, atime REAL);
+            CREATE INDEX IF NOT EXISTS entries_atime ON entries(atime);
+            CREATE TABLE IF NOT EXISTS shards (
+                shard INTEGER PRIMARY KEY, gen INTEGER, size INTEGER, live INTEGER);
+        ''')
+        self._maps = {}      # (shard, gen) -> np.memmap
+        self._touched = {}   # key -> atime, flushed in batches
+        self._stale = []     # shard files replaced by compaction, removed once the index commits
+        self.hits = self.misses = 0
+
+    # --- keys ---
+
+    @staticmethod
+    def key_for(content, params=None):
+        """Hash of the encoded image bytes plus the detector parameters (and OpenCV version)"""
+        h = hashlib.sha256(content)
+        h.update(json.dumps(params or {}, sort_keys=True).encode())
+        h.update(cv2.__version__.encode())
+        return h.hexdigest()
+
+    def _shard_of(self, key):
+        return int(key[:8], 16) % self.shards
+
+    def _path(self, shard, gen):
+        return os.path.join(self.root, f'shard_{shard:02d}.{gen}.bin')
+
+    # --- reads ---
+
+    def _map(self, shard, gen, end):
+        mm = self._maps.get((shard, gen))
+        if mm is None or len(mm) < end:  # not mapped yet, or the file grew since
+            mm = np.memmap(self._path(shard, gen), dtype=np.uint8, mode='r')
+            self._maps = {k: v for k, v in self._maps.items() if k[0] != shard}
+            self._maps[(shard, gen)] = mm
+        return mm
+
+    def get(self, key, retries=3):
+        """(keypoints structured array, descriptors) as read-only views, or None"""
+        for _ in range(retries):
+            row = self.db.execute(
+                'SELECT e.shard, s.gen, e.offset, e.count, e.dtype, e.cols, e.nbytes '
+                'FROM entries e JOIN shards s ON s.shard = e.shard WHERE e.key = ?', (key,)).fetchone()
+            if row is None:
+                break
+            shard, gen, offset, count, dtype, cols, nbytes = row
+            try:
+                mm = self._map(shard, gen, offset + nbytes)
+                break
+            except FileNotFoundError:  # compacted away between the lookup and the open
+                row = None
+        if row is None:
+            self.misses += 1
+            return None
+        kp_bytes = count * KEYPOINT_DTYPE.itemsize
+        keypoints = mm[offset:offset + kp_bytes].view(KEYPOINT_DTYPE)
+        start = offset + _align(kp_bytes)
+        desc_dtype = np.dtype(dtype)
+        descriptors = mm[start:start + count * cols * desc_dtype.itemsize].view(desc_dtype).reshape(count, cols)
+        self.hits += 1
+        self._touched[key] = time.time()
+        if len(self._touched) >= TOUCH_FLUSH:
+            self.flush()
+        return keypoints, descriptors
+
+    def flush(self):
+        if self._touched:
+            self.db.executemany('UPDATE entries SET atime = ? WHERE key = ?',
+                                [(t, k) for k, t in self._touched.items()])
+            self._touched.clear()
+
+    # --- writes ---
+
+    def put(self, key, keypoints, descriptors, descriptor_dtype='uint8'):
+        keypoints = np.ascontiguousarray(keypoints, dtype=KEYPOINT_DTYPE)
+        count = len(keypoints)
+        descriptors = _as_stored(descriptors, descriptor_dtype)
+        cols = descriptors.shape[1] if descriptors.ndim == 2 else 128
+        kp_bytes = keypoints.tobytes()
+        record = kp_bytes + b'\0' * (_align(len(kp_bytes)) - len(kp_bytes)) + descriptors.tobytes()
+        nbytes = _align(len(record))
+        record += b'\0' * (nbytes - len(record))
+        shard = self._shard_of(key)
+
+        self.flush()
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            if self.db.execute('SELECT 1 FROM entries WHERE key = ?', (key,)).fetchone():
+                self.db.execute('COMMIT')  # another process stored it first
+                return
+            row = self.db.execute('SELECT gen, size FROM shards WHERE shard = ?', (shard,)).fetchone()
+            gen, size = row if row else (0, 0)
+            with open(self._path(shard, gen), 'r+b' if row else 'wb') as f:
+                f.seek(size)  # past any bytes a failed writer left behind
+                f.write(record)
+            self.db.execute('INSERT OR REPLACE INTO shards (shard, gen, size, live) VALUES '
+                            '(?, ?, ?, COALESCE((SELECT live FROM shards WHERE shard = ?), 0) + ?)',
+                            (shard, gen, size + nbytes, shard, nbytes))
+            self.db.execute('INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            (key, shard, size, count, descriptor_dtype, cols, nbytes, time.time()))
+            self._evict_locked()
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            self._stale.clear()
+            raise
+        for path in self._stale:
+            try:
+                os.remove(path)  # open maps elsewhere keep the old inode alive (POSIX)
+            except OSError:
+                pass
+        self._stale.clear()
+
+    def _evict_locked(self):
+        (total,) = self.db.execute('SELECT COALESCE(SUM(live), 0) FROM shards').fetchone()
+        if total <= self.max_bytes:
+            return
+        target = total - int(self.max_bytes * 0.9)  # free a little extra so puts don't evict one by one
+        freed = 0
+        victims = []
+        cur = self.db.execute('SELECT key, shard, nbytes FROM entries ORDER BY atime')
+        while freed < target:
+            batch = cur.fetchmany(1024)
+            if not batch:
+                break
+            for key, shard, nbytes in batch:
+                victims.append((key, shard, nbytes))
+                freed += nbytes
+                if freed >= target:
+                    break
+        cur.close()
+        for key, shard, nbytes in victims:
+            self.db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self.db.execute('UPDATE shards SET live = live - ? WHERE shard = ?', (nbytes, shard))
+        for shard in {v[1] for v in victims}:
+            gen, size, live = self.db.execute('SELECT gen, size, live FROM shards WHERE shard = ?',
+                                              (shard,)).fetchone()
+            if live * 2 < size:
+                self._compact_locked(shard, gen)
+
+    def _compact_locked(self, shard, gen):
+        """Copy live records into a new generation file and repoint the index at it"""
+        old_path, new_path = self._path(shard, gen), self._path(shard, gen + 1)
+        rows = self.db.execute('SELECT key, offset, nbytes FROM entries WHERE shard = ? ORDER BY offset',
+                               (shard,)).fetchall()
+        pos = 0
+        with open(old_path, 'rb') as src, open(new_path, 'wb') as dst:
+            for key, offset, nbytes in rows:
+                src.seek(offset)
+                dst.write(src.read(nbytes))
+                self.db.execute('UPDATE entries SET offset = ? WHERE key = ?', (pos, key))
+                pos += nbytes
+        self.db.execute('UPDATE shards SET gen = ?, size = ?, live = ? WHERE shard = ?', (gen + 1, pos, pos, shard))
+        self._maps.pop((shard, gen), None)
+        self._stale.append(old_path)
+
+    # --- convenience ---
+
+    def detect(self, image, sift_params=None, descriptor_dtype='uint8'):
+        """SIFT for an image path or encoded bytes: (keypoints array, descriptors, cache_hit)"""
+        if isinstance(image, (str, os.PathLike)):
+            with open(image, 'rb') as f:
+                image = f.read()
+        params = dict(sift_params or {}, descriptor_dtype=descriptor_dtype)
+        key = self.key_for(image, params)
+        cached = self.get(key)
+        if cached is not None:
+            return cached[0], cached[1], True
+        gray = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise ValueError('could not decode image')
+        keypoints, descriptors, _ = sift_feature_detection(gray, draw=False, sift=cv2.SIFT_create(**(sift_params or {})))
+        if keypoints is None:
+            raise RuntimeError('SIFT is not available in this OpenCV build')
+        keypoints = keypoints_to_array(keypoints)
+        descriptors = _as_stored(descriptors, descriptor_dtype)
+        self.put(key, keypoints, descriptors, descriptor_dtype)
+        return keypoints, descriptors, False
+
+    def stats(self):
+        entries, live = self.db.execute('SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM entries').fetchone()
+        (on_disk,) = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM shards').fetchone()
+        return {'entries': entries, 'live_bytes': live, 'file_bytes': on_disk,
+                'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        self.flush()
+        self._maps.clear()
+        self.db.close()
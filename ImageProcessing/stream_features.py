@@ -0,0 +1,386 @@
+"""Real-time Canny/Harris over a video file, camera or image sequence.
+
+    python stream_features.py clip.mp4 --realtime           # paced at the file's frame rate
+    python stream_features.py 0 --workers 2                  # camera index 0
+    python stream_features.py 'frames/*.png' --fps 30 --realtime
+    python stream_features.py clip.mp4 --drop none --out clip_features/ --save-every 30
+
+Pipeline: a reader thread decodes frames into a fixed pool of frame buffers
+and puts them on a bounded queue. Worker threads take frames off the queue
+and run cvtColor -> GaussianBlur -> Canny and cornerHarris -> dilate. Each
+worker writes into its own preallocated dst arrays, so a steady stream does
+not allocate per frame. A frame buffer goes back to the pool as soon as
+cvtColor has read it. OpenCV releases the GIL inside these calls, so threads
+run in parallel.
+
+When the queue is full, --drop picks what happens to a new frame:
+    oldest   drop the oldest queued frame (default; keeps latency low for live sources)
+    newest   drop the new frame
+    none     the reader waits (processes every frame; for offline files)
+
+Without --realtime a file is read as fast as it decodes, so the number of
+dropped frames shows how far the workers are from keeping up.
+
+Reported per stage (p50/p99/max ms): read (decode), queue (wait before a
+worker picks the frame up), gray, blur, canny, harris, save, and total
+(decoded -> done). Also reported: input and achieved FPS, and the number of
+dropped frames.
+"""
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from batch_features import IMAGE_EXTS, corner_points
+
+STAGES = ('read', 'queue', 'gray', 'blur', 'canny', 'harris', 'save', 'total')
+DROP_POLICIES = ('oldest', 'newest', 'none')
+SAMPLES = 4096  # latency samples kept per stage and thread
+
+
+class StageStats:
+    """Per-stage latency samples (recent SAMPLES per stage) plus counts; one per thread, merged at report time"""
+
+    def __init__(self):
+        self.samples = {s: deque(maxlen=SAMPLES) for s in STAGES}
+        self.count = dict.fromkeys(STAGES, 0)
+
+    def add(self, stage, seconds):
+        self.samples[stage].append(seconds)
+        self.count[stage] += 1
+
+    @staticmethod
+    def summary(stats):
+        out = {}
+        for stage in STAGES:
+            values = [v for s in stats for v in list(s.samples[stage])]
+            if not values:
+                continue
+            ms = np.array(values) * 1000
+            out[stage] = {'n': sum(s.count[stage] for s in stats), 'p50_ms': round(float(np.percentile(ms, 50)), 3),
+                          'p99_ms': round(float(np.percentile(ms, 99)), 3), 'max_ms': round(float(ms.max()), 3)}
+        return out
+
+
+# --- sources ---
+
+class VideoSource:
+    """cv2.VideoCapture over a file, URL or camera index; decodes into the caller's buffer when it fits"""
+
+    def __init__(self, spec):
+        self.live = spec.isdigit()
+        self.cap = cv2.VideoCapture(int(spec) if self.live else spec)
+        if not self.cap.isOpened():
+            raise SystemExit(f'could not open {spec}')
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 0.0
+
+    def read(self, buf):
+        ok, frame = self.cap.read(image=buf) if buf is not None else self.cap.read()
+        return frame if ok else None
+
+    def close(self):
+        self.cap.release()
+
+
+class SequenceSource:
+    """Sorted images from a directory or glob pattern (imread always allocates)"""
+
+    live = False
+
+    def __init__(self, spec, fps=0.0):
+        if os.path.isdir(spec):
+            paths = [os.path.join(spec, n) for n in os.listdir(spec)]
+        else:
+            paths = glob.glob(spec)
+        self.paths = deque(sorted(p for p in paths if os.path.splitext(p)[1].lower() in IMAGE_EXTS))
+        if not self.paths:
+            raise SystemExit(f'no images match {spec}')
+        self.fps = fps
+
+    def read(self, buf):
+        while self.paths:
+            frame = cv2.imread(self.paths.popleft())
+            if frame is not None:
+                return frame
+        return None
+
+    def close(self):
+        pass
+
+
+def open_source(spec, fps=0.0):
+    if spec.isdigit() or not (os.path.isdir(spec) or glob.has_magic(spec)):
+        source = VideoSource(spec)
+        if fps:
+            source.fps = fps
+        return source
+    return SequenceSource(spec, fps)
+
+
+# --- pipeline ---
+
+class FrameQueue:
+    """Bounded FIFO of (index, frame, decoded_at) with a drop policy for when it is full.
+
+    Frames are buffers from a shared pool. A dropped frame's buffer goes
+    straight back to the pool.
+    """
+
+    def __init__(self, size, drop, pool):
+        self.size = size
+        self.drop = drop
+        self.pool = pool
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self.cond:
+            if len(self.items) >= self.size:
+                if self.drop == 'newest':
+                    self.dropped += 1
+                    self.pool.append(item[1])
+                    return
+                if self.drop == 'oldest':
+                    self.dropped += 1
+                    self.pool.append(self.items.popleft()[1])
+                else:
+                    while len(self.items) >= self.size and not self.closed:
+                        self.cond.wait()
+            self.items.append(item)
+            self.cond.notify_all()
+
+    def get(self):
+        """Next item, or None once the queue is closed and empty"""
+        with self.cond:
+            while not self.items and not self.closed:
+                self.cond.wait()
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.cond.notify_all()
+            return item
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def __len__(self):
+        return len(self.items)
+
+
+class FrameProcessor:
+    """Canny + Harris on BGR frames, writing into buffers that are reused while the frame size stays the same"""
+
+    def __init__(self, canny_low=50, canny_high=150, block_size=2, ksize=3, k=0.04):
+        self.canny_low, self.canny_high = canny_low, canny_high
+        self.block_size, self.ksize, self.k = block_size, ksize, k
+        self.shape = None
+
+    def _allocate(self, shape):
+        h, w = shape[:2]
+        self.gray = np.empty((h, w), np.uint8)
+        self.blurred = np.empty((h, w), np.uint8)
+        self.edges = np.empty((h, w), np.uint8)
+        self.response = np.empty((h, w), np.float32)
+        self.harris = np.empty((h, w), np.float32)
+        self.shape = shape
+
+    def gray_from(self, frame):
+        if frame.shape != self.shape:
+            self._allocate(frame.shape)
+        if frame.ndim == 2:
+            np.copyto(self.gray, frame)
+        else:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        return self.gray
+
+    def blur(self):
+        return cv2.GaussianBlur(self.gray, (5, 5), 0, dst=self.blurred)  # as canny_edge_detection
+
+    def canny(self):
+        return cv2.Canny(self.blurred, self.canny_low, self.canny_high, edges=self.edges)
+
+    def corners(self):
+        cv2.cornerHarris(self.gray, self.block_size, self.ksize, self.k, dst=self.response)
+        return cv2.dilate(self.response, None, dst=self.harris)  # as harris_corner_detection
+
+
+def read_frames(source, queue, pool, stats, max_frames, realtime, stop):
+    """Reader thread: decode into pooled buffers and enqueue, paced at source.fps with realtime"""
+    interval = 1.0 / source.fps if realtime and source.fps > 0 and not source.live else 0.0
+    start = time.perf_counter()
+    index = 0
+    try:
+        while not stop.is_set() and (not max_frames or index < max_frames):
+            if interval:
+                delay = start + index * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            buf = pool.popleft() if pool else None
+            t0 = time.perf_counter()
+            frame = source.read(buf)
+            if frame is None:
+                if buf is not None:
+                    pool.append(buf)
+                break
+            t1 = time.perf_counter()
+            stats.add('read', t1 - t0)
+            queue.put((index, frame, t1))
+            index += 1
+    finally:
+        queue.close()
+    return index
+
+
+def work(queue, pool, processor, stats, opts, counter):
+    """Worker thread: run the stages on queued frames until the queue closes"""
+    while True:
+        item = queue.get()
+        if item is None:
+            return
+        index, frame, decoded = item
+        t = time.perf_counter()
+        stats.add('queue', t - decoded)
+
+        processor.gray_from(frame)
+        pool.append(frame)  # the frame's pixels are in processor.gray now; the reader can refill it
+        t, prev = time.perf_counter(), t
+        stats.add('gray', t - prev)
+        if 'canny' in opts['steps']:
+            processor.blur()
+            t, prev = time.perf_counter(), t
+            stats.add('blur', t - prev)
+            edges = processor.canny()
+            t, prev = time.perf_counter(), t
+            stats.add('canny', t - prev)
+        if 'harris' in opts['steps']:
+            harris = processor.corners()
+            t, prev = time.perf_counter(), t
+            stats.add('harris', t - prev)
+        if opts['out'] and index % opts['save_every'] == 0:
+            stem = os.path.join(opts['out'], f'{index:08d}')
+            if 'canny' in opts['steps']:
+                cv2.imwrite(stem + '.edges.png', edges)
+            if 'harris' in opts['steps']:
+                np.save(stem + '.corners.npy', corner_points(harris, opts['harris_thresh']))
+            t, prev = time.perf_counter(), t
+            stats.add('save', t - prev)
+        stats.add('total', t - decoded)
+        with counter['lock']:
+            counter['done'] += 1
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Streaming Canny/Harris over video, camera or image sequences')
+    ap.add_argument('source', help='video file/URL, camera index (e.g. 0), image directory or glob pattern')
+    ap.add_argument('--workers', type=int, default=1, help='processing threads')
+    ap.add_argument('--queue-size', type=int, default=4, help='frames buffered between reader and workers')
+    ap.add_argument('--drop', choices=DROP_POLICIES, default='oldest', help='what to drop when the queue is full')
+    ap.add_argument('--realtime', action='store_true', help='pace files and sequences at their frame rate')
+    ap.add_argument('--fps', type=float, default=0.0, help='source frame rate (required for --realtime sequences)')
+    ap.add_argument('--max-frames', type=int, default=0, help='stop after this many frames (0: until the source ends)')
+    ap.add_argument('--steps', default='canny,harris', help='comma-separated subset of canny,harris')
+    ap.add_argument('--canny-low', type=float, default=50)
+    ap.add_argument('--canny-high', type=float, default=150)
+    ap.add_argument('--block-size', type=int, default=2, help='Harris neighbourhood size')
+    ap.add_argument('--ksize', type=int, default=3, help='Harris Sobel aperture')
+    ap.add_argument('--k', type=float, default=0.04, help='Harris free parameter')
+    ap.add_argument('--harris-thresh', type=float, default=0.01, help='corner threshold as a fraction of the max response')
+    ap.add_argument('--out', default=None, help='directory for <frame>.edges.png / <frame>.corners.npy')
+    ap.add_argument('--save-every', type=int, default=1, help='with --out, save every Nth frame')
+    ap.add_argument('--report', type=float, default=2.0, help='seconds between progress lines (0: off)')
+    ap.add_argument('--json', action='store_true', help='print the final report as JSON')
+    args = ap.parse_args()
+
+    steps = [s.strip() for s in args.steps.split(',') if s.strip()]
+    if not steps or set(steps) - {'canny', 'harris'}:
+        ap.error('--steps must be a subset of canny,harris')
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+    if args.workers > 1:
+        cv2.setNumThreads(1)  # parallelism comes from the workers
+    opts = {'steps': steps, 'out': args.out, 'save_every': max(1, args.save_every), 'harris_thresh': args.harris_thresh}
+
+    source = open_source(args.source, args.fps)
+    if args.realtime and not source.live and source.fps <= 0:
+        ap.error('--realtime needs a frame rate; pass --fps')
+    # queued frames + one per worker (until cvtColor) + one being decoded; deque append/popleft are thread-safe
+    pool = deque()
+    frame_buffers = args.queue_size + args.workers + 1
+    queue = FrameQueue(max(1, args.queue_size), args.drop, pool)
+    stop = threading.Event()
+    reader_stats = StageStats()
+    worker_stats = [StageStats() for _ in range(args.workers)]
+    counter = {'done': 0, 'lock': threading.Lock()}
+    result = {}
+
+    # first frame fixes the buffer size; the pool is filled with matching buffers
+    first = source.read(None)
+    if first is None:
+        raise SystemExit(f'no frames in {args.source}')
+    pool.extend(np.empty_like(first) for _ in range(frame_buffers - 1))
+    t0 = time.perf_counter()
+    queue.put((0, first, t0))
+
+    def reader():
+        result['read'] = 1 + read_frames(source, queue, pool, reader_stats,
+                                         args.max_frames - 1 if args.max_frames else 0, args.realtime, stop)
+
+    threads = [threading.Thread(target=reader, daemon=True)]
+    threads[0].start()
+    for stats in worker_stats:
+        processor = FrameProcessor(args.canny_low, args.canny_high, args.block_size, args.ksize, args.k)
+        threads.append(threading.Thread(target=work, args=(queue, pool, processor, stats, opts, counter), daemon=True))
+        threads[-1].start()
+
+    try:
+        last, last_done = t0, 0
+        while True:
+            alive = next((t for t in threads if t.is_alive()), None)
+            if alive is None:
+                break
+            alive.join(args.report or 1.0)
+            now = time.perf_counter()
+            if args.report and now - last >= args.report and not args.json:
+                done = counter['done']
+                p50 = StageStats.summary([reader_stats] + worker_stats)
+                stages = ' '.join(f"{s}={p50[s]['p50_ms']:.1f}" for s in ('gray', 'canny', 'harris', 'total') if s in p50)
+                print(f'{done} frames, {(done - last_done) / (now - last):.1f} fps, {queue.dropped} dropped, '
+                      f'queue {len(queue)}/{queue.size}, p50 ms: {stages}', flush=True)
+                last, last_done = now, done
+    except KeyboardInterrupt:
+        stop.set()
+        for t in threads:
+            t.join()
+    finally:
+        source.close()
+
+    elapsed = max(time.perf_counter() - t0, 1e-9)
+    done = counter['done']
+    report = {
+        'source': args.source, 'source_fps': round(source.fps, 3), 'workers': args.workers, 'drop': args.drop,
+        'frames_read': result.get('read', 0), 'frames_processed': done, 'frames_dropped': queue.dropped,
+        'seconds': round(elapsed, 3), 'input_fps': round(result.get('read', 0) / elapsed, 2),
+        'achieved_fps': round(done / elapsed, 2), 'stages': StageStats.summary([reader_stats] + worker_stats),
+    }
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(f"{done}/{report['frames_read']} frames processed, {queue.dropped} dropped in {elapsed:.2f}s: "
+          f"{report['achieved_fps']} fps achieved (input {report['input_fps']} fps, source {report['source_fps']})")
+    print(f"{'stage':>8} {'n':>7} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for stage, s in report['stages'].items():
+        print(f"{stage:>8} {s['n']:>7} {s['p50_ms']:>9.3f} {s['p99_ms']:>9.3f} {s['max_ms']:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
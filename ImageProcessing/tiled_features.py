@@ -0,0 +1,205 @@
+"""Tiled, memory-mapped Canny/Harris for images too large to hold in RAM.
+
+The grayscale image is read through a memory map, one overlapping tile at a
+time. Each tile carries a halo derived from the kernel sizes. Workers run
+canny_edge_detection / harris_corner_detection on each tile and write only
+its core into memory-mapped outputs. Peak memory is therefore about
+workers x (tile + 2*halo)^2 x (bytes per pixel across the input and the
+intermediates), not the size of the image.
+
+    python tiled_features.py scan.npy --out scan_features/ --tile 2048 --workers 8
+    python tiled_features.py scan.raw --raw 120000x80000 --out scan_features/
+    python tiled_features.py photo.png --out photo_features/   # decoded once into gray.npy
+
+Inputs: a 2-D uint8 .npy (memory-mapped in place), a raw uint8 file with
+--raw WIDTHxHEIGHT, or any image OpenCV can read. Decoding a compressed
+format needs the whole image in memory once, so convert large scans to
+.npy or raw first.
+
+Outputs in --out:
+    edges.npy     uint8 Canny edge map (0/255), same shape as the input
+    harris.npy    float32 dilated Harris response
+    corners.npy   Harris corners (x, y, response) above --harris-thresh x the global max
+
+Harris matches the whole-image response to within float rounding (the
+sums run in a different order). Canny is not guaranteed to match: hysteresis
+can follow a chain of weak edge pixels of any length, and where that chain
+leaves a tile's halo the tiled result can differ from a whole-image run
+near the seam. --canny-margin (default 256) is extra halo for Canny only.
+With a margin of 32, test images differed in tens to a few hundred pixels.
+Every test image matched exactly from a margin of 200 upward. The margin in
+use is printed at the start of each run. Larger margins cost more work per
+tile: (tile + 2*halo)^2 / tile^2.
+"""
+import argparse
+import os
+import time
+from multiprocessing import Pool
+
+import cv2
+import numpy as np
+
+from feature_detection import canny_edge_detection, harris_corner_detection
+
+CORNER_DTYPE = np.dtype([('x', '<f4'), ('y', '<f4'), ('response', '<f4')])
+STEPS = ('canny', 'harris')
+
+_src = None  # per-worker memory maps, opened once
+_outs = {}
+_opts = None
+
+
+def halo_for(step, opts):
+    """Pixels of context a tile needs on each side for its core to match whole-image output"""
+    if step == 'canny':
+        blur = 5 // 2                 # canny_edge_detection's 5x5 GaussianBlur
+        sobel = 3 // 2                # Canny's default aperture
+        return blur + sobel + 1 + opts['canny_margin']  # +1 non-max suppression, + hysteresis context
+    # cornerHarris: Sobel(ksize) then a blockSize box filter, then a 3x3 dilate
+    return opts['ksize'] // 2 + opts['block_size'] + 1
+
+
+def open_source(path, raw=None):
+    if raw:
+        width, height = (int(v) for v in raw.lower().split('x'))
+        return np.memmap(path, dtype=np.uint8, mode='r', shape=(height, width))
+    if path.endswith('.npy'):
+        src = np.load(path, mmap_mode='r')
+        if src.ndim != 2 or src.dtype != np.uint8:
+            raise SystemExit(f'{path}: expected a 2-D uint8 array, got {src.dtype} {src.shape}')
+        return src
+    return None
+
+
+def tiles(height, width, tile):
+    for y in range(0, height, tile):
+        for x in range(0, width, tile):
+            yield y, min(y + tile, height), x, min(x + tile, width)
+
+
+def _init_worker(src_spec, out_dir, opts):
+    global _src, _outs, _opts
+    cv2.setNumThreads(1)
+    _src = open_source(*src_spec)
+    _opts = opts
+    _outs = {step: np.load(os.path.join(out_dir, name), mmap_mode='r+')
+             for step, name in (('canny', 'edges.npy'), ('harris', 'harris.npy')) if step in opts['steps']}
+
+
+def process_tile(bounds):
+    """Run the steps on one tile plus halo; write the core. Returns the tile's max Harris response."""
+    y0, y1, x0, x1 = bounds
+    h, w = _src.shape
+    peak = 0.0
+    for step in _opts['steps']:
+        halo = halo_for(step, _opts)
+        ty0, ty1, tx0, tx1 = max(0, y0 - halo), min(h, y1 + halo), max(0, x0 - halo), min(w, x1 + halo)
+        window = np.ascontiguousarray(_src[ty0:ty1, tx0:tx1])  # the only read of this region
+        core = (slice(y0 - ty0, y1 - ty0), slice(x0 - tx0, x1 - tx0))
+        if step == 'canny':
+            edges = canny_edge_detection(window, _opts['canny_low'], _opts['canny_high'])
+            _outs['canny'][y0:y1, x0:x1] = edges[core]
+        else:
+            response, _ = harris_corner_detection(window, _opts['block_size'], _opts['ksize'], _opts['k'], draw=False)
+            response = response[core]
+            _outs['harris'][y0:y1, x0:x1] = response
+            peak = max(peak, float(response.max()))
+    for out in _outs.values():
+        out.flush()
+    return peak
+
+
+def extract_corners(harris, thresh, band=1024):
+    """Corner points (one per above-threshold blob) from the response memmap, one row band at a time.
+
+    A blob that touches a band's lower edge is left for the next band, which
+    starts at that blob's top row. Blobs that ended above the previous band's
+    edge were already counted there.
+    """
+    found = []
+    height = harris.shape[0]
+    y, prev_end = 0, 0
+    while y < height:
+        y1 = min(y + band, height)
+        mask = (harris[y:y1] > thresh).astype(np.uint8)
+        n, _, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        next_y = y1
+        for i in range(1, n):
+            top = y + stats[i, cv2.CC_STAT_TOP]
+            bottom = top + stats[i, cv2.CC_STAT_HEIGHT]
+            if bottom < prev_end:
+                continue  # counted in the previous band
+            if bottom == y1 and y1 < height and top > y:
+                next_y = min(next_y, top)  # possibly cut off; rescan from its top
+                continue
+            cx, cy = centroids[i, 0], centroids[i, 1] + y
+            found.append((cx, cy, harris[int(round(cy)), int(round(cx))]))
+        prev_end, y = y1, next_y
+    return np.array(found, dtype=CORNER_DTYPE) if found else np.empty(0, dtype=CORNER_DTYPE)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Tiled, memory-mapped Canny/Harris for very large images')
+    ap.add_argument('image', help='2-D uint8 .npy, raw uint8 file (with --raw), or any image OpenCV reads')
+    ap.add_argument('--raw', default=None, metavar='WxH', help='treat the input as raw uint8 of this size')
+    ap.add_argument('--out', required=True)
+    ap.add_argument('--tile', type=int, default=2048, help='tile edge in pixels (core, without halo)')
+    ap.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    ap.add_argument('--steps', default='canny,harris')
+    ap.add_argument('--canny-low', type=float, default=50)
+    ap.add_argument('--canny-high', type=float, default=150)
+    ap.add_argument('--canny-margin', type=int, default=256,
+                    help='extra halo for Canny hysteresis; smaller is faster but can differ at seams')
+    ap.add_argument('--block-size', type=int, default=2)
+    ap.add_argument('--ksize', type=int, default=3)
+    ap.add_argument('--k', type=float, default=0.04)
+    ap.add_argument('--harris-thresh', type=float, default=0.01)
+    args = ap.parse_args()
+
+    steps = [s.strip() for s in args.steps.split(',') if s.strip()]
+    if set(steps) - set(STEPS):
+        ap.error(f'unknown steps: {", ".join(sorted(set(steps) - set(STEPS)))}')
+    os.makedirs(args.out, exist_ok=True)
+    src_spec = (args.image, args.raw)
+    src = open_source(*src_spec)
+    if src is None:
+        gray = cv2.imread(args.image, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise SystemExit(f'could not read {args.image}')
+        src_spec = (os.path.join(args.out, 'gray.npy'), None)
+        np.save(src_spec[0], gray)
+        del gray
+        src = open_source(*src_spec)
+    height, width = src.shape
+
+    opts = {'steps': steps, 'canny_low': args.canny_low, 'canny_high': args.canny_high,
+            'canny_margin': args.canny_margin, 'block_size': args.block_size, 'ksize': args.ksize, 'k': args.k}
+    if 'canny' in steps:
+        np.lib.format.open_memmap(os.path.join(args.out, 'edges.npy'), 'w+', np.uint8, (height, width)).flush()
+    if 'harris' in steps:
+        np.lib.format.open_memmap(os.path.join(args.out, 'harris.npy'), 'w+', np.float32, (height, width)).flush()
+
+    jobs = list(tiles(height, width, args.tile))
+    halo = max(halo_for(s, opts) for s in steps)
+    print(f'{width}x{height} in {len(jobs)} tiles of {args.tile}px (+{halo}px halo), {args.workers} workers')
+    if 'canny' in steps:
+        print(f'canny margin {args.canny_margin}px: edges may differ from a whole-image run where weak edges '
+              f'cross a seam beyond it')
+    t0 = time.perf_counter()
+    with Pool(args.workers, initializer=_init_worker, initargs=(src_spec, args.out, opts)) as pool:
+        peaks = []
+        for i, peak in enumerate(pool.imap_unordered(process_tile, jobs), 1):
+            peaks.append(peak)
+            if i % 50 == 0:
+                print(f'  {i}/{len(jobs)} tiles', flush=True)
+    print(f'tiles done in {time.perf_counter() - t0:.1f}s')
+
+    if 'harris' in steps:
+        harris = np.load(os.path.join(args.out, 'harris.npy'), mmap_mode='r')
+        corners = extract_corners(harris, args.harris_thresh * max(peaks, default=0.0))
+        np.save(os.path.join(args.out, 'corners.npy'), corners)
+        print(f'{len(corners)} corners')
+
+
+if __name__ == '__main__':
+    main()
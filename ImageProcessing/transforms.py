@@ -0,0 +1,135 @@
+"""Composable affine transforms: chain any number of steps, resample once.
+
+Each step is a 3x3 matrix, so a chain collapses into one matrix product and
+one cv2.warpAffine call. That saves a full-image pass per extra step and
+avoids blurring the result by interpolating it several times.
+
+    t = Affine.rotate(45, center=(w / 2, h / 2)).then(Affine.scale(0.7)).then(Affine.translate(50, 30))
+    out = warp(img, t)
+
+WarpBatch applies many transforms to one source and keeps preallocated
+destination buffers between calls (warpAffine writes into dst in place).
+"""
+import cv2
+import numpy as np
+
+
+class Affine:
+    """A 2-D affine transform (3x3, last row 0 0 1), mapping source pixels to destination pixels."""
+
+    __slots__ = ('m',)
+
+    def __init__(self, m=None):
+        self.m = np.eye(3) if m is None else np.asarray(m, dtype=np.float64)
+
+    @classmethod
+    def from_matrix(cls, m2x3):
+        m = np.eye(3)
+        m[:2] = m2x3
+        return cls(m)
+
+    @classmethod
+    def rotate(cls, angle, center=(0.0, 0.0), scale=1.0):
+        """Counter-clockwise degrees about center, as cv2.getRotationMatrix2D"""
+        return cls.from_matrix(cv2.getRotationMatrix2D((float(center[0]), float(center[1])), angle, scale))
+
+    @classmethod
+    def scale(cls, fx, fy=None, pixel_centers=True):
+        """Resize by fx, fy. pixel_centers=True puts samples where cv2.resize puts them."""
+        fy = fx if fy is None else fy
+        if pixel_centers:
+            return cls([[fx, 0, 0.5 * fx - 0.5], [0, fy, 0.5 * fy - 0.5], [0, 0, 1]])
+        return cls([[fx, 0, 0], [0, fy, 0], [0, 0, 1]])
+
+    @classmethod
+    def translate(cls, tx, ty):
+        return cls([[1, 0, tx], [0, 1, ty], [0, 0, 1]])
+
+    @classmethod
+    def shear(cls, sx=0.0, sy=0.0):
+        return cls([[1, sx, 0], [sy, 1, 0], [0, 0, 1]])
+
+    def then(self, other):
+        """This transform followed by other"""
+        return Affine(other.m @ self.m)
+
+    def inverse(self):
+        return Affine(np.linalg.inv(self.m))
+
+    @property
+    def matrix(self):
+        """2x3 float64 matrix for cv2.warpAffine"""
+        return self.m[:2]
+
+    def bounds(self, width, height):
+        """(x0, y0, x1, y1) of the transformed source rectangle"""
+        corners = np.array([[0, 0, 1], [width, 0, 1], [0, height, 1], [width, height, 1]], dtype=np.float64)
+        pts = corners @ self.m[:2].T
+        return pts[:, 0].min(), pts[:, 1].min(), pts[:, 0].max(), pts[:, 1].max()
+
+    def __repr__(self):
+        return f'Affine({self.m[:2].round(6).tolist()})'
+
+
+def compose(*transforms):
+    """Affine applying transforms left to right"""
+    out = Affine()
+    for t in transforms:
+        out = out.then(t)
+    return out
+
+
+def fit(transform, width, height):
+    """transform shifted so the whole result is visible, and the dsize that holds it"""
+    x0, y0, x1, y1 = transform.bounds(width, height)
+    return transform.then(Affine.translate(-x0, -y0)), (int(np.ceil(x1 - x0)), int(np.ceil(y1 - y0)))
+
+
+def warp(img, transform, dsize=None, dst=None, interpolation=cv2.INTER_LINEAR,
+         border_mode=cv2.BORDER_CONSTANT, border_value=0):
+    """One warpAffine for the whole chain. dsize defaults to the source size; dst is reused when it fits."""
+    if dsize is None:
+        dsize = (img.shape[1], img.shape[0])
+    return cv2.warpAffine(img, transform.matrix, dsize, dst=dst, flags=interpolation,
+                          borderMode=border_mode, borderValue=border_value)
+
+
+class WarpBatch:
+    """Apply many transforms to one source, writing into reusable preallocated buffers.
+
+    Outputs that share a dsize come from one (n, h, w[, c]) block. The block
+    is allocated again only when the source dtype/channels, the dsize or the
+    count changes, so repeated runs (e.g. per video frame) don't allocate.
+    Returned arrays are views into the buffers and are overwritten by the
+    next run(); copy any you need to keep.
+    """
+
+    def __init__(self, interpolation=cv2.INTER_LINEAR, border_mode=cv2.BORDER_CONSTANT, border_value=0):
+        self.interpolation = interpolation
+        self.border_mode = border_mode
+        self.border_value = border_value
+        self.buffers = {}  # dsize -> array of shape (n, h, w[, c])
+
+    def _buffer(self, img, dsize, n):
+        shape = (n, dsize[1], dsize[0]) + img.shape[2:]
+        buf = self.buffers.get(dsize)
+        if buf is None or buf.shape != shape or buf.dtype != img.dtype:
+            buf = self.buffers[dsize] = np.empty(shape, dtype=img.dtype)
+        return buf
+
+    def run(self, img, transforms, dsizes=None):
+        """transforms: list of Affine; dsizes: one (w, h) for all, a list per transform, or None for the source size"""
+        if dsizes is None or (len(dsizes) == 2 and np.isscalar(dsizes[0])):
+            dsizes = [tuple(dsizes) if dsizes is not None else (img.shape[1], img.shape[0])] * len(transforms)
+        groups = {}
+        for i, dsize in enumerate(dsizes):
+            groups.setdefault(tuple(dsize), []).append(i)
+        out = [None] * len(transforms)
+        for dsize, idx in groups.items():
+            buf = self._buffer(img, dsize, len(idx))
+            for slot, i in enumerate(idx):
+                dst = buf[slot]
+                res = cv2.warpAffine(img, transforms[i].matrix, dsize, dst=dst, flags=self.interpolation,
+                                     borderMode=self.border_mode, borderValue=self.border_value)
+                out[i] = dst if res is dst or np.shares_memory(res, dst) else res
+        return out
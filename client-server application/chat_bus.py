@@ -0,0 +1,137 @@
+"""Local pub/sub bus linking chat_server worker processes (--workers N).
+
+Workers send each room/topic publish to the hub over a Unix socket. The
+hub gives room messages their seq and encodes the client frame once, then
+fans the same bytes out to every worker. So all workers see one order per
+room.
+
+The hub also owns each room's RoomLog (seq, epoch, recent frames), so a
+client can resume on any worker. A worker joining a client sends a "replay"
+request. The hub answers that worker alone with the client's missed frames
+("replay"), then "joined". Live frames the worker reads after "joined" are
+newer than the replay, so the worker adds the member at that point.
+The hub keeps at most max_rooms room logs, and drops a room's log after
+room_ttl seconds without a publish or join (least recently used first).
+A recreated room gets a new epoch, so resuming clients are told to reset.
+
+Hub -> worker message: a small JSON envelope {"op", "key", "seq"[, "client"]}
+followed by the ready-to-send client frame.
+"""
+import os
+import socket
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List
+from common import encode_frame, send_msg, recv_msg, recv_frame
+from room_log import RoomLog
+
+
+def default_path() -> str:
+    return os.path.join(tempfile.gettempdir(), f"chat_bus_{os.getpid()}.sock")
+
+
+class BusHub:
+    def __init__(self, path: str, history: int = 256, room_ttl: float = 600.0, max_rooms: int = 4096):
+        self.path = path
+        if os.path.exists(path):
+            os.unlink(path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen(64)
+        self.workers: List[socket.socket] = []
+        self.history, self.room_ttl, self.max_rooms = history, room_ttl, max_rooms
+        self.rooms: "OrderedDict[str, list]" = OrderedDict()  # name -> [RoomLog, last used], LRU first
+        # One lock orders seq assignment, replays and delivery to every worker. Workers
+        # only enqueue what they read, so these sends don't wait on chat clients.
+        self.lock = threading.Lock()
+
+    def serve_forever(self) -> None:
+        while True:
+            conn, _ = self.server.accept()
+            with self.lock:
+                self.workers.append(conn)
+            threading.Thread(target=self._worker_loop, args=(conn,), daemon=True).start()
+
+    def _worker_loop(self, conn: socket.socket) -> None:
+        try:
+            while True:
+                msg = recv_msg(conn)
+                op, key, payload = msg.get("op"), msg.get("key"), msg.get("payload")
+                with self.lock:
+                    if op == "replay":
+                        self._replay(conn, key, payload)
+                        continue
+                    seq = None
+                    if op == "room":
+                        log = self._room(key)
+                        frame = log.record(payload)
+                        seq = log.seq
+                    else:
+                        frame = encode_frame(payload)
+                    envelope = encode_frame({"op": op, "key": key, "seq": seq}) + frame
+                    for w in list(self.workers):
+                        try:
+                            w.sendall(envelope)
+                        except OSError:
+                            self.workers.remove(w)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with self.lock:
+                if conn in self.workers:
+                    self.workers.remove(conn)
+            conn.close()
+
+    def _room(self, key: str) -> RoomLog:
+        now = time.monotonic()
+        entry = self.rooms.get(key)
+        if entry is None:
+            entry = self.rooms[key] = [RoomLog(key, self.history), now]
+        else:
+            entry[1] = now
+            self.rooms.move_to_end(key)
+        while len(self.rooms) > self.max_rooms or (
+                self.room_ttl > 0 and next(iter(self.rooms.values()))[1] < now - self.room_ttl):
+            self.rooms.popitem(last=False)
+        return entry[0]
+
+    def _replay(self, conn: socket.socket, key: str, req: dict) -> None:
+        """Send one worker the frames its client missed, then "joined" (called under the lock)."""
+        client = req.get("client")
+        frames = self._room(key).replay(req.get("since_seq"), req.get("epoch"))
+        head = encode_frame({"op": "replay", "key": key, "seq": None, "client": client})
+        conn.sendall(b"".join(head + f for f in frames)
+                     + encode_frame({"op": "joined", "key": key, "seq": None, "client": client}) + encode_frame(None))
+
+    def close(self) -> None:
+        self.server.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class BusClient:
+    """Worker side: publish() goes to the hub; on_deliver(op, key, seq, frame, client) runs for everything it sends."""
+
+    def __init__(self, path: str, on_deliver: Callable[[str, str, int, bytes, int], None]):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.on_deliver = on_deliver
+        self.lock = threading.Lock()
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def publish(self, op: str, key, payload) -> None:
+        with self.lock:
+            send_msg(self.sock, {"op": op, "key": key, "payload": payload})
+
+    def _read_loop(self) -> None:
+        try:
+            while True:
+                env = recv_msg(self.sock)
+                frame = recv_frame(self.sock)
+                self.on_deliver(env["op"], env["key"], env["seq"], frame, env.get("client"))
+        except (ConnectionError, OSError):
+            # Without the hub this worker can't reach the rest of the cluster
+            print("chat bus disconnected; worker exiting", flush=True)
+            os._exit(1)
@@ -1,54 +1,186 @@
+import itertools
 import socket
 import threading
 import sys
+import time
 from common import send_msg, recv_msg
 
 HOST = "127.0.0.1"
 PORT = 12346
+RECONNECT_DELAYS = (0.5, 1, 2, 5)  # seconds; the last one repeats
+# After this long with nothing received the client pings; a second silent
+# period means the connection is dead (e.g. half-open) and it reconnects.
+RECV_TIMEOUT = 45
 
+HELP = ("/join <room> | /leave <room> | /room <room> (send to) | "
+        "/sub <topic> | /unsub <topic> | /pub <topic> <text> | /quit")
 
-def receiver(sock: socket.socket):
-    try:
-        while True:
+
+class ChatSession:
+    """Connection plus what's needed to resume it: joined rooms, topics and the last seq seen per room.
+
+    After a drop the receiver reconnects and rejoins every room with since_seq,
+    so the server replays only the messages that were missed.
+    """
+
+    def __init__(self, name: str, room: str = "lobby"):
+        self.name = name
+        self.room = room              # where plain lines are sent
+        self.rooms = [room]
+        self.topics = set()
+        self.last_seq = {}            # room -> highest seq received
+        self.epoch = {}               # room -> epoch those seqs belong to
+        self.sock = None
+        self.send_lock = threading.Lock()
+        self.stopping = False
+
+    def connect(self) -> None:
+        sock = socket.create_connection((HOST, PORT))
+        sock.settimeout(RECV_TIMEOUT)
+        first, rest = self.rooms[0] if self.rooms else "lobby", self.rooms[1:]
+        send_msg(sock, {"type": "join", "name": self.name, "room": first, **self.resume_point(first)})
+        for room in rest:
+            send_msg(sock, {"type": "join_room", "room": room, **self.resume_point(room)})
+        for topic in self.topics:
+            send_msg(sock, {"type": "subscribe", "topic": topic})
+        self.sock = sock
+
+    def resume_point(self, room: str) -> dict:
+        return {"since_seq": self.last_seq.get(room), "epoch": self.epoch.get(room)}
+
+    def send(self, obj) -> None:
+        with self.send_lock:
+            try:
+                send_msg(self.sock, obj)
+            except OSError:
+                print("\r[!] not connected; message not sent\n>> ", end="", flush=True)
+
+    def _reconnect(self) -> bool:
+        for attempt in itertools.count():
+            if self.stopping:
+                return False
+            time.sleep(RECONNECT_DELAYS[min(attempt, len(RECONNECT_DELAYS) - 1)])
+            try:
+                with self.send_lock:
+                    self.connect()
+                print("\r[*] reconnected\n>> ", end="", flush=True)
+                return True
+            except OSError:
+                continue
+
+    def show(self, msg: dict) -> None:
+        room = msg.get("room")
+        seq = msg.get("seq")
+        epoch = msg.get("epoch")
+        if room and epoch is not None and epoch != self.epoch.get(room):
+            # The room was recreated (or the server restarted): its seqs start over
+            self.epoch[room] = epoch
+            self.last_seq.pop(room, None)
+        if room and seq is not None:
+            if seq <= self.last_seq.get(room, 0):
+                return  # already seen (overlap after a resume)
+            self.last_seq[room] = seq
+        t = msg.get("type")
+        where = f"#{room} " if room else (f"@{msg['topic']} " if msg.get("topic") else "")
+        if t == "system":
+            print(f"\r[*] {where}{msg.get('text')}\n>> ", end="", flush=True)
+        elif t == "msg":
+            sender = msg.get("from", "?")
+            text = msg.get("text", "")
+            print(f"\r{where}{sender}: {text}\n>> ", end="", flush=True)
+        elif t == "error":
+            print(f"\r[!] {msg.get('text')}\n>> ", end="", flush=True)
+
+    def receiver(self) -> None:
+        probing = False
+        while not self.stopping:
             try:
-                msg = recv_msg(sock)
-            except (socket.timeout, TimeoutError):
-                continue  # keep waiting for messages
+                try:
+                    msg = recv_msg(self.sock)
+                except (socket.timeout, TimeoutError):
+                    if probing:
+                        raise ConnectionError("no reply to ping")
+                    probing = True
+                    self.send({"type": "ping"})
+                    continue
+            except Exception as e:
+                if self.stopping:
+                    return
+                print(f"\r[Disconnected: {e}; reconnecting...]", flush=True)
+                probing = False
+                if not self._reconnect():
+                    return
+                continue
+            probing = False
             if not isinstance(msg, dict):
                 continue
-            t = msg.get("type")
-            if t == "system":
-                print(f"\r[*] {msg.get('text')}\n>> ", end="", flush=True)
-            elif t == "msg":
-                sender = msg.get("from", "?")
-                text = msg.get("text", "")
-                print(f"\r{sender}: {text}\n>> ", end="", flush=True)
-    except Exception as e:
-        print(f"\r[Disconnected: {e}]", flush=True)
+            if msg.get("type") == "ping":
+                self.send({"type": "pong"})
+            elif msg.get("type") != "pong":
+                self.show(msg)
+
+    def command(self, line: str) -> bool:
+        """Handle a /command; returns False when the client should exit."""
+        parts = line.split(maxsplit=2)
+        cmd, arg = parts[0].lower(), (parts[1] if len(parts) > 1 else "")
+        if cmd in {"/quit", "/exit"}:
+            self.stopping = True
+            self.send({"type": "quit"})
+            return False
+        if cmd == "/join" and arg:
+            if arg not in self.rooms:
+                self.rooms.append(arg)
+            self.send({"type": "join_room", "room": arg, **self.resume_point(arg)})
+            self.room = arg
+        elif cmd == "/leave" and arg:
+            if arg in self.rooms:
+                self.rooms.remove(arg)
+            self.send({"type": "leave_room", "room": arg})
+        elif cmd == "/room" and arg:
+            self.room = arg
+        elif cmd == "/sub" and arg:
+            self.topics.add(arg)
+            self.send({"type": "subscribe", "topic": arg})
+        elif cmd == "/unsub" and arg:
+            self.topics.discard(arg)
+            self.send({"type": "unsubscribe", "topic": arg})
+        elif cmd == "/pub" and len(parts) == 3:
+            self.send({"type": "msg", "topic": arg, "text": parts[2]})
+        else:
+            print(HELP)
+        return True
 
 
 def main():
     name = input("Enter your name: ").strip() or "anonymous"
+    session = ChatSession(name)
     try:
-        with socket.create_connection((HOST, PORT)) as sock:
-            sock.settimeout(3600)
-            send_msg(sock, {"type": "join", "name": name})
-            t = threading.Thread(target=receiver, args=(sock,), daemon=True)
-            t.start()
-            while True:
-                try:
-                    line = input(">> ")
-                except (EOFError, KeyboardInterrupt):
-                    break
-                if not line:
-                    continue
-                if line.strip().lower() in {"/quit", "/exit"}:
-                    send_msg(sock, {"type": "quit"})
-                    break
-                send_msg(sock, {"type": "msg", "text": line})
+        session.connect()
     except ConnectionRefusedError:
         print("Chat server not running. Start chat_server.py first.")
         sys.exit(1)
+    print(HELP)
+    t = threading.Thread(target=session.receiver, daemon=True)
+    t.start()
+    try:
+        while True:
+            try:
+                line = input(">> ")
+            except (EOFError, KeyboardInterrupt):
+                break
+            if not line:
+                continue
+            if line.startswith("/"):
+                if not session.command(line.strip()):
+                    break
+                continue
+            session.send({"type": "msg", "room": session.room, "text": line})
+    finally:
+        session.stopping = True
+        try:
+            session.sock.close()
+        except OSError:
+            pass
 
 
 if __name__ == "__main__":
@@ -0,0 +1,229 @@
+"""Load generator for chat_server.py.
+
+Opens N simulated clients on one asyncio loop, using the common.py framing.
+The clients are split into rooms of a given size, and each one publishes at
+a fixed rate. Every message carries its send time, so each receiver can
+record the end-to-end broadcast latency. Each (clients, room size)
+combination is a separate run. A run reports the delivery rate, any frames
+that never arrived (drops) and the p50/p99/max latency.
+
+    python chat_load.py --clients 100,1000 --room-size 10,100 --rate 2 --duration 10
+    python chat_load.py --clients 5000 --room-size 50 --json load.json
+
+Every client is a member of its own room, so each message is expected once
+per member, the sender included. Counts come from the measured window only,
+after a short drain at the end. For thousands of clients, raise the server's
+open-file limit (ulimit -n) as well.
+"""
+import argparse
+import asyncio
+import json
+import struct
+import sys
+import time
+from common import HEADER_LEN, encode_frame
+
+HOST = "127.0.0.1"
+PORT = 12346
+PING_REPLY = encode_frame({"type": "pong"})
+
+
+def raise_fd_limit() -> None:
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100.0 * len(sorted_values)))]
+
+
+class Run:
+    """Shared counters for one scenario. Everything runs on one event loop, so no locks are needed."""
+
+    def __init__(self, clients: int, room_size: int):
+        self.clients = clients
+        self.room_size = room_size
+        self.room_members = {}
+        self.measure_from = self.measure_until = None
+        self.sent = 0
+        self.expected = 0
+        self.delivered = 0
+        self.latencies = []  # ns
+        self.connect_errors = 0
+        self.server_stats = None
+
+    def room_of(self, i: int) -> str:
+        return f"load-{i // self.room_size}"
+
+
+async def read_frame(reader: asyncio.StreamReader):
+    header = await reader.readexactly(HEADER_LEN)
+    (length,) = struct.unpack(">I", header)
+    return json.loads(await reader.readexactly(length))
+
+
+async def receive(run: Run, reader, writer, stats_waiter=None):
+    clock = time.perf_counter_ns
+    try:
+        while True:
+            msg = await read_frame(reader)
+            t = msg.get("type")
+            if t == "msg":
+                sent_at = int(msg["text"].split(":", 1)[0])
+                if run.measure_from <= sent_at < run.measure_until:
+                    run.delivered += 1
+                    run.latencies.append(clock() - sent_at)
+            elif t == "ping":
+                writer.write(PING_REPLY)
+            elif t == "stats" and stats_waiter is not None and not stats_waiter.done():
+                stats_waiter.set_result(msg.get("data"))
+    except (asyncio.IncompleteReadError, ConnectionError, OSError):
+        pass
+
+
+async def publish(run: Run, i: int, writer, rate: float, stop_at: int):
+    room = run.room_of(i)
+    members = run.room_members[room]
+    interval = 1.0 / rate
+    # Spread the first sends over one interval so clients don't publish in lockstep
+    await asyncio.sleep(interval * (i % 97) / 97)
+    clock = time.perf_counter_ns
+    n = 0
+    while True:
+        now = clock()
+        if now >= stop_at:
+            return
+        writer.write(encode_frame({"type": "msg", "room": room, "text": f"{now}:{i}:{n}"}))
+        if run.measure_from <= now < run.measure_until:
+            run.sent += 1
+            run.expected += members
+        n += 1
+        await writer.drain()
+        await asyncio.sleep(interval)
+
+
+async def connect(run: Run, i: int, args, sem: asyncio.Semaphore):
+    async with sem:
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(args.host, args.port), args.timeout)
+        except (OSError, asyncio.TimeoutError):
+            run.connect_errors += 1
+            return None
+        writer.write(encode_frame({"type": "join", "name": f"load{i}", "room": run.room_of(i)}))
+        await writer.drain()
+        return i, reader, writer
+
+
+async def run_scenario(args, clients: int, room_size: int) -> dict:
+    run = Run(clients, room_size)
+    sem = asyncio.Semaphore(args.connect_concurrency)
+    t0 = time.perf_counter()
+    conns = [c for c in await asyncio.gather(*(connect(run, i, args, sem) for i in range(clients))) if c]
+    connect_s = time.perf_counter() - t0
+    for i, _, _ in conns:
+        room = run.room_of(i)
+        run.room_members[room] = run.room_members.get(room, 0) + 1
+
+    now = time.perf_counter_ns()
+    run.measure_from = now + int((args.settle + args.warmup) * 1e9)
+    run.measure_until = run.measure_from + int(args.duration * 1e9)
+    loop = asyncio.get_running_loop()
+    stats_waiter = loop.create_future()
+    readers = [asyncio.ensure_future(receive(run, r, w, stats_waiter if k == 0 else None))
+               for k, (_, r, w) in enumerate(conns)]
+    await asyncio.sleep(args.settle)  # let join notices go by before publishing
+    await asyncio.gather(*(publish(run, i, w, args.rate, run.measure_until) for i, _, w in conns))
+    await asyncio.sleep(args.drain)
+
+    if conns:
+        conns[0][2].write(encode_frame({"type": "stats"}))
+        try:
+            run.server_stats = await asyncio.wait_for(stats_waiter, 2)
+        except asyncio.TimeoutError:
+            pass
+    for _, _, w in conns:
+        w.close()
+    for t in readers:
+        t.cancel()
+    await asyncio.gather(*readers, return_exceptions=True)
+
+    lat = sorted(run.latencies)
+    stats = run.server_stats or {}
+    return {
+        "clients": clients,
+        "connected": len(conns),
+        "connect_errors": run.connect_errors,
+        "connect_s": round(connect_s, 2),
+        "room_size": room_size,
+        "rooms": len(run.room_members),
+        "rate_per_client": args.rate,
+        "sent": run.sent,
+        "send_rate": round(run.sent / args.duration, 1),  # below clients*rate: the generator fell behind
+        "expected": run.expected,
+        "delivered": run.delivered,
+        "drops": max(0, run.expected - run.delivered),
+        "drop_pct": round(100.0 * (run.expected - run.delivered) / run.expected, 3) if run.expected else 0.0,
+        "delivery_rate": round(run.delivered / args.duration, 1),
+        "latency_ms": {
+            "p50": round(percentile(lat, 50) / 1e6, 3),
+            "p99": round(percentile(lat, 99) / 1e6, 3),
+            "max": round(lat[-1] / 1e6, 3) if lat else 0.0,
+        },
+        "server_dropped_total": stats.get("chat_dropped_total"),
+    }
+
+
+def parse_list(text: str):
+    return [int(v) for v in text.split(",") if v.strip()]
+
+
+async def main_async(args):
+    results = []
+    for clients in parse_list(args.clients):
+        for room_size in parse_list(args.room_size):
+            r = await run_scenario(args, clients, room_size)
+            results.append(r)
+            lat = r["latency_ms"]
+            print(f"clients={r['connected']}/{clients} room_size={room_size} rooms={r['rooms']}: "
+                  f"sent={r['sent']} ({r['send_rate']:,.0f}/s) delivered={r['delivered']}/{r['expected']} "
+                  f"({r['delivery_rate']:,.0f}/s) drops={r['drops']} ({r['drop_pct']}%) "
+                  f"latency ms p50={lat['p50']} p99={lat['p99']} max={lat['max']}", flush=True)
+            await asyncio.sleep(args.pause)  # let the server reap the previous run's connections
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser(description="chat_server load generator")
+    ap.add_argument("--host", default=HOST)
+    ap.add_argument("--port", type=int, default=PORT)
+    ap.add_argument("--clients", default="100", help="comma-separated client counts, e.g. 100,1000")
+    ap.add_argument("--room-size", default="10", help="comma-separated members per room, e.g. 10,100")
+    ap.add_argument("--rate", type=float, default=1.0, help="messages per second per client")
+    ap.add_argument("--duration", type=float, default=10.0, help="measured seconds")
+    ap.add_argument("--warmup", type=float, default=1.0)
+    ap.add_argument("--settle", type=float, default=1.0, help="seconds after connecting before publishing")
+    ap.add_argument("--drain", type=float, default=2.0, help="seconds to wait for late deliveries")
+    ap.add_argument("--pause", type=float, default=1.0, help="seconds between scenarios")
+    ap.add_argument("--connect-concurrency", type=int, default=200)
+    ap.add_argument("--timeout", type=float, default=5.0, help="connect timeout")
+    ap.add_argument("--json", default=None, help="write results to this file")
+    args = ap.parse_args()
+    raise_fd_limit()
+    try:
+        results = asyncio.run(main_async(args))
+    except KeyboardInterrupt:
+        sys.exit(1)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
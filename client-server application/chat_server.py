@@ -1,105 +1,554 @@
+import argparse
+import itertools
+import logging
+import os
 import socket
 import threading
+import time
+from collections import deque
 from datetime import datetime, timezone
-from typing import Dict
-from common import send_msg, recv_msg
+from multiprocessing import Process
+from typing import Dict, Set
+from common import encode_frame, decode_frame, send_frames, recv_frame
+from metrics import Registry, log_sampled, serve_http, setup_logging
+from room_log import RoomLog
+from timer_wheel import IdleTracker, TimerWheel
 
 HOST = "0.0.0.0"
 PORT = 12346  # chat runs on a different port from the RPC demo
 
-clients: Dict[socket.socket, str] = {}
+# Outbound queue per client; what to do when a client can't keep up:
+#   drop_oldest - discard its oldest queued message to make room
+#   disconnect  - drop the client
+QUEUE_SIZE = 1024
+SLOW_POLICIES = ("drop_oldest", "disconnect")
+SLOW_POLICY = "drop_oldest"
+
+# The server pings a client after HEARTBEAT quiet seconds and closes it after
+# IDLE_TIMEOUT seconds without any frame (clients answer with a pong).
+HEARTBEAT = 30.0
+IDLE_TIMEOUT = 90.0
+PING_FRAME = encode_frame({"type": "ping"})
+wheel = TimerWheel()
+
+log = logging.getLogger("chat")
+LOG_SAMPLE = 0.01  # fraction of per-message debug lines kept
+
+metrics = Registry("chat_")
+connections_total = metrics.counter("connections_total", "accepted connections")
+connections_open = metrics.gauge("connections_open", "clients that completed the join")
+frames_in = metrics.counter("frames_in_total", "frames received from clients")
+frames_out = metrics.counter("frames_out_total", "frames written to client sockets")
+bytes_in = metrics.counter("bytes_in_total", "bytes received (incl. headers)")
+bytes_out = metrics.counter("bytes_out_total", "bytes written (incl. headers)")
+dropped_total = metrics.counter("dropped_total", "queued frames discarded for slow clients")
+slow_disconnects = metrics.counter("slow_disconnects_total", "clients dropped by --slow-policy disconnect")
+message_seconds = metrics.histogram("message_seconds", "time to handle one client message", ("type",))
+heartbeats_sent = metrics.counter("heartbeats_sent_total", "pings sent to quiet clients")
+idle_evictions = metrics.counter("idle_evictions_total", "connections closed by the idle timeout")
+fanout_seconds = metrics.histogram("fanout_seconds", "time to enqueue one broadcast to all recipients", ("kind",))
+
+
+class ClientConn:
+    """A connected chat client with a bounded outbound queue drained by its own writer thread."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, conn: socket.socket, addr, name: str):
+        self.id = next(self._ids)  # names this client in bus replays (--workers)
+        self.conn = conn
+        self.addr = addr
+        self.name = name
+        self.queue = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+        self.rooms: Set[str] = set()   # guarded by clients_lock
+        self.topics: Set[str] = set()
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    def enqueue(self, frame: bytes) -> bool:
+        """Queue a frame from encode_frame. Never blocks; returns False if the client is (now) disconnected."""
+        with self.cond:
+            if self.closed:
+                return False
+            if len(self.queue) >= QUEUE_SIZE:
+                if SLOW_POLICY == "disconnect":
+                    slow_disconnects.inc()
+                    self._close_locked()
+                    return False
+                self.queue.popleft()
+                self.dropped += 1
+                dropped_total.inc()
+            self.queue.append(frame)
+            self.cond.notify()
+        return True
+
+    def _write_loop(self):
+        try:
+            while True:
+                with self.cond:
+                    while not self.queue and not self.closed:
+                        self.cond.wait()
+                    if self.closed:
+                        return
+                    batch = list(self.queue)
+                    self.queue.clear()
+                send_frames(self.conn, batch)
+                frames_out.inc(len(batch))
+                bytes_out.inc(sum(map(len, batch)))
+        except Exception:
+            self.close()
+
+    def _close_locked(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self.cond.notify()
+        try:
+            # Unblocks this client's reader (recv) and writer (send) threads
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        with self.cond:
+            self._close_locked()
+
+
+class Room:
+    """Member index plus the room's RoomLog (seq, epoch and recent frames).
+
+    Each room message gets the next seq. Numbering, recording and enqueueing
+    happen under the room lock, so every member sees one order with no gaps,
+    and a rejoining member can be replayed exactly what it missed. In
+    --workers mode the bus hub keeps the RoomLog and this worker's Room is
+    just its local members.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.members: Set[ClientConn] = set()
+        self.log = RoomLog(name, HISTORY_SIZE)
+        self.lock = threading.Lock()
+        self.emptied = None  # monotonic time the last member left, while the room is idle
+        self.expiry = None   # its ROOM_TTL timer
+
+    def publish(self, payload) -> list:
+        """Returns members that could not take the frame (disconnected)."""
+        with self.lock:
+            return self._deliver_locked(self.log.record(payload))
+
+    def deliver(self, frame: bytes) -> list:
+        """Like publish, for a frame already numbered and recorded by the --workers bus hub."""
+        with self.lock:
+            return self._deliver_locked(frame)
+
+    def _deliver_locked(self, frame: bytes) -> list:
+        t0 = time.perf_counter()
+        failed = [c for c in self.members if not c.enqueue(frame)]
+        fanout_seconds.labels("room").observe(time.perf_counter() - t0)
+        return failed
+
+    def add(self, client: ClientConn, since_seq=None, since_epoch=None) -> None:
+        with self.lock:
+            self.members.add(client)
+            for frame in self.log.replay(since_seq, since_epoch):
+                client.enqueue(frame)
+
+    def remove(self, client: ClientConn) -> None:
+        with self.lock:
+            self.members.discard(client)
+
+
+clients: Dict[socket.socket, ClientConn] = {}
+client_ids: Dict[int, ClientConn] = {}
+# Rooms and topics are indexed by member so fan-out costs O(members), not O(all
+# clients). Empty topics are dropped at once. A room whose last member leaves
+# is kept ROOM_TTL seconds (so reconnecting clients can resume from its
+# history), and at most MAX_IDLE_ROOMS such rooms are kept, longest-empty
+# evicted first. Dicts and sets are guarded by clients_lock (taken before a
+# Room's own lock).
+rooms: Dict[str, Room] = {}
+idle_rooms: Dict[str, Room] = {}  # rooms without members, in the order they emptied
+topics: Dict[str, Set[ClientConn]] = {}
 clients_lock = threading.Lock()
+DEFAULT_ROOM = "lobby"
+HISTORY_SIZE = 256  # recent frames kept per room for since_seq resume
+ROOM_TTL = 600.0
+MAX_IDLE_ROOMS = 1024
+BUS = None  # chat_bus.BusClient in --workers mode: publishes go through the hub
+
+
+def queue_depth() -> int:
+    with clients_lock:
+        targets = list(clients.values())
+    return sum(len(c.queue) for c in targets)
+
+
+queued_frames = metrics.gauge("queued_frames", "frames waiting in all outbound queues", fn=queue_depth)
+rooms_open = metrics.gauge("rooms", "rooms held in memory (with members or idle)", fn=lambda: len(rooms))
+idle_rooms_open = metrics.gauge("idle_rooms", "rooms without members kept for resume", fn=lambda: len(idle_rooms))
 
 
 def now_utc_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
-def broadcast(payload, exclude=None):
-    to_remove = []
+def drop_clients(failed):
+    if failed:
+        with clients_lock:
+            for client in failed:
+                clients.pop(client.conn, None)
+
+
+def fan_out(targets, frame: bytes, kind: str):
+    # Encoded once; every recipient queues the same bytes object. Enqueueing never blocks on a socket.
+    t0 = time.perf_counter()
+    failed = [c for c in targets if not c.enqueue(frame)]
+    fanout_seconds.labels(kind).observe(time.perf_counter() - t0)
+    drop_clients(failed)
+
+
+def broadcast_room(room: str, payload):
+    if BUS is not None:
+        BUS.publish("room", room, payload)
+        return
     with clients_lock:
-        for conn in list(clients.keys()):
-            if exclude is not None and conn is exclude:
-                continue
-            try:
-                send_msg(conn, payload)
-            except Exception:
-                to_remove.append(conn)
-        for c in to_remove:
-            try:
-                clients.pop(c, None)
-                c.close()
-            except Exception:
-                pass
+        r = rooms.get(room)
+    if r is not None:
+        drop_clients(r.publish(payload))
+
+
+def publish_topic(topic: str, payload):
+    if BUS is not None:
+        BUS.publish("topic", topic, payload)
+        return
+    with clients_lock:
+        targets = list(topics.get(topic, ()))
+    fan_out(targets, encode_frame(payload), "topic")
+
+
+def deliver_from_bus(op: str, key, seq, frame: bytes, client_id=None):
+    """Hub relay callback: hand a frame published on any worker to this worker's members."""
+    if op == "room":
+        with clients_lock:
+            r = rooms.get(key)  # rooms this worker doesn't host are not created here
+        if r is not None:
+            drop_clients(r.deliver(frame))
+    elif op == "replay":
+        with clients_lock:
+            client = client_ids.get(client_id)
+        if client is not None:
+            client.enqueue(frame)
+    elif op == "joined":
+        # Replay is done; live frames read from here on are newer, so membership starts now
+        with clients_lock:
+            client = client_ids.get(client_id)
+            if client is None or key not in client.rooms:
+                return  # gone, or left before the hub answered
+            r = rooms.get(key)
+            if r is None:
+                r = rooms[key] = Room(key)
+            r.add(client)
+    elif op == "topic":
+        with clients_lock:
+            targets = list(topics.get(key, ()))
+        fan_out(targets, frame, "topic")
+
+
+def subscribe(client: ClientConn, topic: str) -> None:
+    with clients_lock:
+        client.topics.add(topic)
+        topics.setdefault(topic, set()).add(client)
+
+
+def unsubscribe(client: ClientConn, topic: str) -> None:
+    with clients_lock:
+        client.topics.discard(topic)
+        members = topics.get(topic)
+        if members is not None:
+            members.discard(client)
+            if not members:
+                del topics[topic]
+
+
+def _room_emptied_locked(r: Room) -> None:
+    if BUS is not None or not HISTORY_SIZE or ROOM_TTL <= 0 or MAX_IDLE_ROOMS <= 0:
+        del rooms[r.name]  # nothing worth keeping for a resume (or the hub keeps it)
+        return
+    stamp = r.emptied = time.monotonic()
+    r.expiry = wheel.schedule(ROOM_TTL, lambda: expire_room(r, stamp))
+    idle_rooms[r.name] = r
+    while len(idle_rooms) > MAX_IDLE_ROOMS:
+        _drop_idle_locked(next(iter(idle_rooms.values())))
+
+
+def _drop_idle_locked(r: Room) -> None:
+    wheel.cancel(r.expiry)
+    r.expiry = r.emptied = None
+    idle_rooms.pop(r.name, None)
+    if rooms.get(r.name) is r:
+        del rooms[r.name]
+
+
+def expire_room(r: Room, stamp: float) -> None:
+    with clients_lock:
+        if r.emptied == stamp:  # still the same idle spell; a rejoin clears it
+            _drop_idle_locked(r)
+
+
+def join_room(client: ClientConn, room: str, since_seq=None, since_epoch=None):
+    """since_seq/since_epoch: last seq (and its epoch) the client saw in this room; newer retained frames are replayed first."""
+    with clients_lock:
+        if room in client.rooms:
+            return
+        client.rooms.add(room)
+        if BUS is None:
+            r = rooms.get(room)
+            if r is None:
+                r = rooms[room] = Room(room)
+            elif idle_rooms.pop(room, None) is not None:
+                wheel.cancel(r.expiry)
+                r.expiry = r.emptied = None
+            r.add(client, since_seq, since_epoch)
+    if BUS is not None:
+        # The hub replays from its RoomLog, then sends "joined" (see deliver_from_bus)
+        BUS.publish("replay", room, {"client": client.id, "since_seq": since_seq, "epoch": since_epoch})
+    broadcast_room(room, {"type": "system", "room": room, "text": f"{client.name} joined", "ts": now_utc_iso()})
+
+
+def leave_room(client: ClientConn, room: str):
+    with clients_lock:
+        if room not in client.rooms:
+            return
+        client.rooms.discard(room)
+        r = rooms.get(room)  # None in --workers mode if the hub hasn't confirmed the join yet
+        if r is not None:
+            r.remove(client)
+            if not r.members:
+                _room_emptied_locked(r)
+    broadcast_room(room, {"type": "system", "room": room, "text": f"{client.name} left", "ts": now_utc_iso()})
+
+
+def room_name(msg: dict) -> str:
+    return str(msg.get("room") or DEFAULT_ROOM).strip() or DEFAULT_ROOM
+
+
+MESSAGE_TYPES = {"msg", "join_room", "leave_room", "subscribe", "unsubscribe", "stats", "ping", "pong", "quit"}
+
+
+def read_msg(conn: socket.socket, tracker: IdleTracker):
+    frame = recv_frame(conn)
+    tracker.touch()
+    frames_in.inc()
+    bytes_in.inc(len(frame))
+    return decode_frame(frame)
+
+
+def evict(conn: socket.socket, addr) -> None:
+    log.info("IDLE %s, closing", addr)
+    idle_evictions.inc()
+    try:
+        conn.shutdown(socket.SHUT_RDWR)  # reader and writer threads fail and clean up as usual
+    except OSError:
+        pass
 
 
 def handle_client(conn: socket.socket, addr):
     name = None
+    client = None
+
+    def ping():
+        if client is not None and client.enqueue(PING_FRAME):
+            heartbeats_sent.inc()
+
+    # Started before the join, so connections that never send one are reaped too
+    tracker = IdleTracker(wheel, IDLE_TIMEOUT, lambda: evict(conn, addr), HEARTBEAT, ping)
     try:
         # Expect a join message first
-        hello = recv_msg(conn)
+        hello = read_msg(conn, tracker)
         if not isinstance(hello, dict) or hello.get("type") != "join":
             return
         name = str(hello.get("name", "anonymous")).strip() or "anonymous"
-        print(f"JOIN {addr} as {name}")
+        log.info("JOIN %s as %s", addr, name)
+        client = ClientConn(conn, addr, name)
+        connections_open.inc()
         with clients_lock:
-            clients[conn] = name
-        broadcast({"type": "system", "text": f"{name} joined", "ts": now_utc_iso()}, exclude=None)
+            clients[conn] = client
+            client_ids[client.id] = client
+        join_room(client, room_name(hello), hello.get("since_seq"), hello.get("epoch"))
         # Receive chat messages
         while True:
-            msg = recv_msg(conn)
+            msg = read_msg(conn, tracker)
             if not isinstance(msg, dict):
                 continue
+            t0 = time.perf_counter()
             mtype = msg.get("type")
             if mtype == "msg":
                 text = str(msg.get("text", ""))
-                print(f"MSG from {name}@{addr}: {text}")
-                broadcast({
-                    "type": "msg",
-                    "from": name,
-                    "text": text,
-                    "ts": now_utc_iso()
-                }, exclude=None)
+                if msg.get("topic") is not None:
+                    topic = str(msg["topic"])
+                    publish_topic(topic, {"type": "msg", "topic": topic, "from": name, "text": text,
+                                          "ts": now_utc_iso()})
+                else:
+                    room = room_name(msg)
+                    if room not in client.rooms:
+                        client.enqueue(encode_frame({"type": "error", "text": f"not in room {room}"}))
+                    else:
+                        log_sampled(log, logging.DEBUG, LOG_SAMPLE, "MSG from %s@%s in %s: %s", name, addr, room, text)
+                        broadcast_room(room, {
+                            "type": "msg",
+                            "room": room,
+                            "from": name,
+                            "text": text,
+                            "ts": now_utc_iso()
+                        })
+            elif mtype == "join_room":
+                join_room(client, room_name(msg), msg.get("since_seq"), msg.get("epoch"))
+            elif mtype == "leave_room":
+                leave_room(client, room_name(msg))
+            elif mtype == "subscribe":
+                subscribe(client, str(msg.get("topic", "")))
+            elif mtype == "unsubscribe":
+                unsubscribe(client, str(msg.get("topic", "")))
+            elif mtype == "stats":
+                # This process only; with --workers each worker keeps its own registry
+                client.enqueue(encode_frame({"type": "stats", "pid": os.getpid(), "data": metrics.snapshot()}))
+            elif mtype == "ping":
+                client.enqueue(encode_frame({"type": "pong"}))
             elif mtype == "quit":
                 break
+            message_seconds.labels(mtype if mtype in MESSAGE_TYPES else "unknown").observe(time.perf_counter() - t0)
     except Exception:
         pass
     finally:
+        tracker.stop()
         with clients_lock:
-            if conn in clients:
-                clients.pop(conn, None)
+            clients.pop(conn, None)
+            if client is not None:
+                client_ids.pop(client.id, None)
+        if client is not None:
+            connections_open.dec()
+            client.close()
+            for topic in list(client.topics):
+                unsubscribe(client, topic)
+            for room in list(client.rooms):
+                leave_room(client, room)
         try:
             conn.close()
         except Exception:
             pass
         if name:
-            print(f"LEAVE {addr} ({name})")
-            broadcast({"type": "system", "text": f"{name} left", "ts": now_utc_iso()}, exclude=None)
+            log.info("LEAVE %s (%s)", addr, name)
 
 
-def main():
-    print(f"Chat server listening on {HOST}:{PORT}")
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    server.bind((HOST, PORT))
-    server.listen(100)
+def serve(server: socket.socket):
     try:
         while True:
             conn, addr = server.accept()
-            print(f"Accepted {addr}")
+            connections_total.inc()
+            log.debug("Accepted %s", addr)
             threading.Thread(target=handle_client, args=(conn, addr), daemon=True).start()
     except KeyboardInterrupt:
-        print("\nShutting down chat server...")
+        log.info("\nShutting down chat server...")
     finally:
         with clients_lock:
-            for c in list(clients.keys()):
-                try:
-                    c.close()
-                except Exception:
-                    pass
+            for client in list(clients.values()):
+                client.close()
             clients.clear()
         server.close()
 
 
+def make_listener(reuse_port: bool = False) -> socket.socket:
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    server.bind((HOST, PORT))
+    server.listen(100)
+    return server
+
+
+def run_worker(args, bus_path: str, index: int):
+    """Worker process for --workers: own listener on the shared port, publishes via the bus."""
+    global BUS
+    configure(args)
+    from chat_bus import BusClient
+    BUS = BusClient(bus_path, deliver_from_bus)
+    log.info("Chat worker %s listening on %s:%s", os.getpid(), HOST, PORT)
+    if args.metrics_port:
+        start_metrics(args.metrics_port + index)
+    serve(make_listener(reuse_port=True))
+
+
+def start_metrics(port: int):
+    serve_http(metrics, port)
+    log.info("Metrics on http://%s:%s/metrics", HOST, port)
+
+
+def configure(args):
+    global QUEUE_SIZE, SLOW_POLICY, HISTORY_SIZE, ROOM_TTL, MAX_IDLE_ROOMS, LOG_SAMPLE, HEARTBEAT, IDLE_TIMEOUT
+    QUEUE_SIZE, SLOW_POLICY, HISTORY_SIZE = args.queue_size, args.slow_policy, args.history
+    ROOM_TTL, MAX_IDLE_ROOMS = args.room_ttl, args.max_idle_rooms
+    HEARTBEAT, IDLE_TIMEOUT = args.heartbeat, args.idle_timeout
+    LOG_SAMPLE = args.log_sample
+    setup_logging(args.log_level)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Chat server")
+    ap.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="max queued outbound messages per client")
+    ap.add_argument("--slow-policy", choices=SLOW_POLICIES, default=SLOW_POLICY)
+    ap.add_argument("--history", type=int, default=HISTORY_SIZE,
+                    help="recent messages kept per room for reconnecting clients (0 = off)")
+    ap.add_argument("--room-ttl", type=float, default=ROOM_TTL,
+                    help="seconds an empty room keeps its history (0 = drop rooms as soon as they empty)")
+    ap.add_argument("--hub-rooms", type=int, default=4096,
+                    help="--workers: rooms whose seq/history the bus hub keeps; least recently used dropped first")
+    ap.add_argument("--max-idle-rooms", type=int, default=MAX_IDLE_ROOMS,
+                    help="empty rooms kept at once; the longest-empty are dropped first")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="N worker processes sharing the port (SO_REUSEPORT) linked by a local pub/sub bus")
+    ap.add_argument("--heartbeat", type=float, default=HEARTBEAT,
+                    help="ping clients quiet for this many seconds (0 = no pings)")
+    ap.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                    help="close clients with no frames for this many seconds (0 = never)")
+    ap.add_argument("--metrics-port", type=int, default=None,
+                    help="serve Prometheus text on :PORT/metrics (worker i uses PORT+i)")
+    ap.add_argument("--log-level", default="INFO", help="DEBUG shows sampled per-message lines")
+    ap.add_argument("--log-sample", type=float, default=LOG_SAMPLE, help="fraction of per-message lines kept")
+    args = ap.parse_args()
+    configure(args)
+
+    if args.workers <= 1:
+        log.info("Chat server listening on %s:%s", HOST, PORT)
+        if args.metrics_port:
+            start_metrics(args.metrics_port)
+        serve(make_listener())
+        return
+
+    if not hasattr(socket, "SO_REUSEPORT") or not hasattr(socket, "AF_UNIX"):
+        raise SystemExit("--workers needs SO_REUSEPORT and AF_UNIX (Linux/BSD)")
+    from chat_bus import BusHub, default_path
+    hub = BusHub(default_path(), args.history, args.room_ttl, args.hub_rooms)
+    threading.Thread(target=hub.serve_forever, daemon=True).start()
+    procs = [Process(target=run_worker, args=(args, hub.path, i), daemon=True) for i in range(args.workers)]
+    for p in procs:
+        p.start()
+    log.info("Chat server: %s workers on %s:%s, bus at %s", args.workers, HOST, PORT, hub.path)
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        log.info("\nShutting down chat server...")
+    finally:
+        for p in procs:
+            p.terminate()
+        hub.close()
+
+
 if __name__ == "__main__":
     main()
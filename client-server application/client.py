@@ -1,15 +1,44 @@
+import array
 import socket
 import sys
-from common import send_msg, recv_msg
+from common import send_array, send_msg, recv_msg
 
 HOST = "127.0.0.1"
 PORT = 12345
 
 
+def call_array(sock: socket.socket, cmd: str, *arrays, **params):
+    """sum/mean/histogram with one array, dot with two; arrays go as binary typed-array frames."""
+    send_msg(sock, dict(params, cmd=cmd, arrays=True))
+    for a in arrays:
+        send_array(sock, a)
+    return recv_msg(sock)
+
+
+def stream_array(sock: socket.socket, cmd: str, chunks, **params):
+    """Send chunks (tuples of two for dot) then the empty end marker; returns the final reply."""
+    send_msg(sock, dict(params, cmd=cmd, stream=True))
+    for chunk in chunks:
+        for a in (chunk if isinstance(chunk, tuple) else (chunk,)):
+            send_array(sock, a)
+    send_array(sock, array.array("d"))
+    reply = recv_msg(sock)
+    while params.get("partials") and reply.get("ok") and reply["data"].get("partial"):
+        print("  partial ->", reply["data"])
+        reply = recv_msg(sock)
+    return reply
+
+
 def demo_sequence(sock: socket.socket) -> None:
     send_msg(sock, {"cmd": "ping"}); print("PING ->", recv_msg(sock))
     send_msg(sock, {"cmd": "echo", "data": {"hello": "world"}}); print("ECHO ->", recv_msg(sock))
     send_msg(sock, {"cmd": "sum", "numbers": [1, 2, 3.5]}); print("SUM ->", recv_msg(sock))
+    xs = array.array("d", range(1_000_000))
+    print("SUM (binary) ->", call_array(sock, "sum", xs))
+    print("DOT ->", call_array(sock, "dot", array.array("d", [1, 2, 3]), array.array("d", [4, 5, 6])))
+    print("HISTOGRAM ->", call_array(sock, "histogram", xs, bins=4))
+    chunks = [xs[i:i + 250_000] for i in range(0, len(xs), 250_000)]
+    print("MEAN (streamed) ->", stream_array(sock, "mean", chunks, partials=True))
 
 
 def interactive(sock: socket.socket) -> None:
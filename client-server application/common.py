@@ -1,15 +1,49 @@
+import array
 import json
 import socket
 import struct
-from typing import Any
+import sys
+from typing import Any, List, Tuple
 
 HEADER_LEN = 4  # 4-byte big-endian length prefix
+IOV_BATCH = 512  # frames per sendmsg call (stays under IOV_MAX)
 
+# Typed-array frames: the length header has ARRAY_FLAG set and the body is
+# ARRAY_HDR (array-module typecode, element count) followed by the raw
+# little-endian elements. JSON frames never get near 2 GiB, so the flag is free.
+ARRAY_FLAG = 0x80000000
+ARRAY_HDR = struct.Struct("<c7xQ")  # 16 bytes, so 8-byte elements stay aligned
+ARRAY_DTYPES = {"b": "<i1", "B": "<u1", "h": "<i2", "H": "<u2", "i": "<i4", "I": "<u4",
+                "q": "<i8", "Q": "<u8", "f": "<f4", "d": "<f8"}  # typecode -> NumPy dtype
+_TYPECODES = {v: k for k, v in ARRAY_DTYPES.items()}
+MAX_ARRAY_BYTES = 1 << 30
 
-def send_msg(sock: socket.socket, obj: Any) -> None:
+
+def encode_frame(obj: Any) -> bytes:
+    """Header + JSON body as one immutable bytes object; encode once, send to many sockets."""
     data = json.dumps(obj, separators=(",", ":")).encode("utf-8")
-    header = struct.pack(">I", len(data))
-    sock.sendall(header + data)
+    return struct.pack(">I", len(data)) + data
+
+
+def send_msg(sock: socket.socket, obj: Any) -> None:
+    sock.sendall(encode_frame(obj))
+
+
+def send_frames(sock: socket.socket, frames: List[bytes]) -> None:
+    """Send pre-encoded frames, coalesced into as few sendmsg calls as possible."""
+    if not hasattr(sock, "sendmsg"):  # e.g. Windows
+        sock.sendall(b"".join(frames))
+        return
+    for i in range(0, len(frames), IOV_BATCH):
+        bufs = [memoryview(f) for f in frames[i:i + IOV_BATCH]]
+        while bufs:
+            sent = sock.sendmsg(bufs)
+            # Drop fully written buffers and trim a partially written one
+            while bufs and sent >= len(bufs[0]):
+                sent -= len(bufs[0])
+                bufs.pop(0)
+            if bufs and sent:
+                bufs[0] = bufs[0][sent:]
 
 
 def recv_exact(sock: socket.socket, n: int) -> bytes:
@@ -22,6 +56,95 @@ def recv_exact(sock: socket.socket, n: int) -> bytes:
     return bytes(buf)
 
 
+def recv_frame(sock: socket.socket) -> bytes:
+    """One whole frame (header + body) as raw bytes, e.g. to forward without re-encoding."""
+    header = recv_exact(sock, HEADER_LEN)
+    (length,) = struct.unpack(">I", header)
+    return header + recv_exact(sock, length)
+
+
+def decode_frame(frame: bytes) -> Any:
+    return json.loads(frame[HEADER_LEN:])
+
+
+def recv_into_exact(sock: socket.socket, view: memoryview) -> None:
+    got = 0
+    while got < len(view):
+        n = sock.recv_into(view[got:])
+        if not n:
+            raise ConnectionError("Socket closed")
+        got += n
+
+
+def recv_header(sock: socket.socket) -> Tuple[int, bool]:
+    """(body length, is_array) for the next frame."""
+    (word,) = struct.unpack(">I", recv_exact(sock, HEADER_LEN))
+    return word & ~ARRAY_FLAG, bool(word & ARRAY_FLAG)
+
+
+def array_header(typecode: str, count: int) -> bytes:
+    if typecode not in ARRAY_DTYPES:
+        raise ValueError(f"unsupported typecode {typecode!r}")
+    size = count * array.array(typecode).itemsize
+    return struct.pack(">I", (ARRAY_HDR.size + size) | ARRAY_FLAG) + ARRAY_HDR.pack(typecode.encode(), count)
+
+
+def send_array(sock: socket.socket, values, typecode: str = None) -> None:
+    """Send a typed-array frame. values: array.array, NumPy array, or any sequence of numbers.
+
+    Arrays already in little-endian layout go out without a copy (header and
+    data are gathered into one sendmsg call).
+    """
+    if hasattr(values, "dtype"):  # NumPy
+        if typecode is None:
+            dt = values.dtype
+            typecode = _TYPECODES.get(f"<{dt.kind}{dt.itemsize}")
+            if typecode is None:
+                raise ValueError(f"unsupported dtype {dt}")
+        data = values.astype(ARRAY_DTYPES[typecode], copy=False)
+        if not data.flags.c_contiguous:
+            data = data.copy()
+        count, view = data.size, memoryview(data).cast("B")
+    else:
+        if not isinstance(values, array.array) or (typecode and values.typecode != typecode):
+            values = array.array(typecode or "d", values)
+        typecode = values.typecode
+        if sys.byteorder == "big":
+            values = array.array(typecode, values)
+            values.byteswap()
+        count, view = len(values), memoryview(values).cast("B")
+    send_frames(sock, [array_header(typecode, count), view])
+
+
+def recv_array_body(sock: socket.socket, length: int) -> Tuple[str, memoryview]:
+    """Read an array frame body (after recv_header) into one buffer; returns (typecode, raw little-endian bytes)."""
+    if length < ARRAY_HDR.size or length > MAX_ARRAY_BYTES:
+        raise ValueError(f"bad array frame length {length}")
+    buf = bytearray(length)
+    view = memoryview(buf)
+    recv_into_exact(sock, view)
+    code, count = ARRAY_HDR.unpack_from(buf)
+    typecode = code.decode("ascii", "replace")
+    if typecode not in ARRAY_DTYPES or count * array.array(typecode).itemsize != length - ARRAY_HDR.size:
+        raise ValueError(f"bad array header {typecode!r} x {count}")
+    return typecode, view[ARRAY_HDR.size:]
+
+
+def decode_array(typecode: str, data: memoryview, np=None):
+    """View the received bytes as numbers without copying.
+
+    With NumPy passed as np this is np.frombuffer; otherwise a memoryview cast
+    to the typecode (copied into a byteswapped array only on big-endian hosts).
+    """
+    if np is not None:
+        return np.frombuffer(data, dtype=ARRAY_DTYPES[typecode])
+    if sys.byteorder == "big":
+        values = array.array(typecode, data.tobytes())
+        values.byteswap()
+        return values
+    return data.cast(typecode)
+
+
 def recv_msg(sock: socket.socket) -> Any:
     header = recv_exact(sock, HEADER_LEN)
     (length,) = struct.unpack(">I", header)
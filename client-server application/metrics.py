@@ -0,0 +1,196 @@
+"""Small in-process metrics registry for the socket servers.
+
+Counters, gauges and fixed-bucket histograms, each guarded by its own lock.
+snapshot() returns a plain dict for the `stats` command. render() produces
+the Prometheus text format, and serve_http() exposes it on /metrics.
+
+log_sampled() replaces per-message prints: it checks the log level first and
+then keeps only a fraction of the records.
+"""
+import bisect
+import logging
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Sequence, Tuple
+
+# Seconds; suits sub-millisecond command handling up to slow broadcasts
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, n: float = 1) -> None:
+        with self.lock:
+            self.value += n
+
+
+class Gauge:
+    """Set directly, or pass fn to compute the value when scraped (e.g. total queue depth)."""
+
+    def __init__(self, fn: Callable[[], float] = None):
+        self.value = 0
+        self.fn = fn
+        self.lock = threading.Lock()
+
+    def inc(self, n: float = 1) -> None:
+        with self.lock:
+            self.value += n
+
+    def dec(self, n: float = 1) -> None:
+        with self.lock:
+            self.value -= n
+
+    def set(self, v: float) -> None:
+        self.value = v
+
+    def get(self) -> float:
+        return self.fn() if self.fn else self.value
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, v: float) -> None:
+        i = bisect.bisect_left(self.bounds, v)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += v
+            self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (inf if it is past the last bound)."""
+        target = q * self.count
+        seen = 0
+        for bound, c in zip(self.bounds + (float("inf"),), self.counts):
+            seen += c
+            if c and seen >= target:
+                return bound
+        return 0.0
+
+
+class _Family:
+    """One metric name; children keyed by label values."""
+
+    def __init__(self, kind: str, help: str, labelnames: Tuple[str, ...], factory):
+        self.kind, self.help, self.labelnames, self.factory = kind, help, labelnames, factory
+        self.children: Dict[Tuple[str, ...], object] = {}
+        self.lock = threading.Lock()
+        if not labelnames:
+            self.children[()] = factory()
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self.factory())
+        return child
+
+    # Unlabelled families act as their single child
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.children[()], name)
+
+
+class Registry:
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self.families: Dict[str, _Family] = {}
+
+    def _add(self, name, kind, help, labelnames, factory):
+        fam = _Family(kind, help, tuple(labelnames), factory)
+        self.families[self.prefix + name] = fam
+        return fam
+
+    def counter(self, name: str, help: str = "", labelnames: Sequence[str] = ()):
+        return self._add(name, "counter", help, labelnames, Counter)
+
+    def gauge(self, name: str, help: str = "", fn: Callable[[], float] = None):
+        return self._add(name, "gauge", help, (), lambda: Gauge(fn))
+
+    def histogram(self, name: str, help: str = "", labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        return self._add(name, "histogram", help, labelnames, lambda: Histogram(buckets))
+
+    def snapshot(self) -> dict:
+        out = {}
+        for name, fam in self.families.items():
+            for key, m in list(fam.children.items()):
+                label = name + ("{" + ",".join(f"{n}={v}" for n, v in zip(fam.labelnames, key)) + "}" if key else "")
+                if fam.kind == "histogram":
+                    p50, p99 = m.quantile(0.5), m.quantile(0.99)
+                    out[label] = {
+                        "count": m.count,
+                        "sum": round(m.sum, 6),
+                        "p50_le": "+Inf" if p50 == float("inf") else p50,
+                        "p99_le": "+Inf" if p99 == float("inf") else p99,
+                    }
+                elif fam.kind == "gauge":
+                    out[label] = m.get()
+                else:
+                    out[label] = m.value
+        return out
+
+    def render(self) -> str:
+        lines = []
+        for name, fam in self.families.items():
+            lines.append(f"# HELP {name} {fam.help}")
+            lines.append(f"# TYPE {name} {fam.kind}")
+            for key, m in list(fam.children.items()):
+                labels = ",".join(f'{n}="{v}"' for n, v in zip(fam.labelnames, key))
+                if fam.kind == "histogram":
+                    cum = 0
+                    for bound, c in zip(m.bounds + (float("inf"),), m.counts):
+                        cum += c
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        sep = "," if labels else ""
+                        lines.append(f'{name}_bucket{{{labels}{sep}le="{le}"}} {cum}')
+                    suffix = "{" + labels + "}" if labels else ""
+                    lines.append(f"{name}_sum{suffix} {m.sum}")
+                    lines.append(f"{name}_count{suffix} {m.count}")
+                else:
+                    suffix = "{" + labels + "}" if labels else ""
+                    value = m.get() if fam.kind == "gauge" else m.value
+                    lines.append(f"{name}{suffix} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def serve_http(registry: Registry, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Prometheus text endpoint at http://host:port/metrics, served from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def log_sampled(logger: logging.Logger, level: int, rate: float, msg: str, *args) -> None:
+    if rate > 0 and logger.isEnabledFor(level) and (rate >= 1 or random.random() < rate):
+        logger.log(level, msg, *args)
+
+
+def setup_logging(level: str = "INFO") -> None:
+    logging.basicConfig(level=getattr(logging, level.upper(), logging.INFO), format="%(message)s")
@@ -0,0 +1,60 @@
+"""Per-room seq numbering and replay history for the chat server (and its --workers bus hub).
+
+A room's messages are numbered 1, 2, 3... within an epoch: a random id fixed
+when the RoomLog is created. Each room frame carries both "seq" and "epoch".
+When a room is evicted and later recreated (or the server restarts), its seq
+starts again at 1 under a new epoch. A client resuming with an old since_seq
+is then told to reset, rather than discarding the new messages as duplicates.
+"""
+import uuid
+from collections import deque
+from typing import List, Optional
+
+from common import encode_frame
+
+
+def new_epoch() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+class RoomLog:
+    """Seq counter plus a ring of the newest `history` (seq, frame) pairs. Not thread-safe; the owner locks."""
+
+    def __init__(self, name: str, history: int):
+        self.name = name
+        self.epoch = new_epoch()
+        self.seq = 0
+        self.history = deque(maxlen=history) if history > 0 else None
+
+    def record(self, payload: dict) -> bytes:
+        """Number and encode a room message, remembering it for replay."""
+        self.seq += 1
+        payload["seq"], payload["epoch"] = self.seq, self.epoch
+        frame = encode_frame(payload)
+        if self.history is not None:
+            self.history.append((self.seq, frame))
+        return frame
+
+    def replay(self, since_seq, since_epoch: Optional[str] = None) -> List[bytes]:
+        """Frames for a client that last saw since_seq, oldest first; [] if since_seq is None.
+
+        A "reset" notice comes first when since_seq belongs to another epoch
+        or is past this room's seq (the numbering the client knew is gone).
+        A "gap" notice comes first when the retained history doesn't reach
+        back far enough.
+        """
+        if since_seq is None:
+            return []
+        since_seq = int(since_seq)
+        out = []
+        if (since_epoch is not None and since_epoch != self.epoch) or since_seq > self.seq:
+            out.append(encode_frame({"type": "system", "room": self.name, "reset": True, "epoch": self.epoch,
+                                     "text": "room was restarted; message numbering starts over"}))
+            since_seq = 0
+        history = self.history or ()
+        oldest = history[0][0] if history else self.seq + 1
+        if since_seq < oldest - 1:
+            out.append(encode_frame({"type": "system", "room": self.name, "gap": True, "epoch": self.epoch,
+                                     "text": f"history truncated; missed messages before seq {oldest}"}))
+        out.extend(frame for seq, frame in history if seq > since_seq)
+        return out
@@ -1,70 +1,210 @@
+import argparse
+import json
+import logging
 import socket
 import threading
+import time
 from datetime import datetime, timezone
-from common import send_msg, recv_msg
+from common import (HEADER_LEN, decode_array, encode_frame, recv_array_body, recv_exact,
+                    recv_header)
+from metrics import Registry, log_sampled, serve_http, setup_logging
+from timer_wheel import IdleTracker, TimerWheel
+from vector_ops import VECTOR_CMDS, VectorAccumulator, np
 
 HOST = "0.0.0.0"
 PORT = 12345
 
-print(f"Starting RPC server on {HOST}:{PORT} ...")
+log = logging.getLogger("rpc")
+LOG_SAMPLE = 0.01  # fraction of per-request debug lines kept
+# Connections silent this long are closed. Request/response clients don't
+# expect unsolicited frames, so they keep alive with {"cmd":"ping"} themselves.
+IDLE_TIMEOUT = 300.0
+wheel = TimerWheel()
 
-server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-server_sock.bind((HOST, PORT))
-server_sock.listen(50)
-print("Server listening; press Ctrl+C to stop.")
+metrics = Registry("rpc_")
+connections_total = metrics.counter("connections_total", "accepted connections")
+connections_open = metrics.gauge("connections_open", "currently connected clients")
+frames_in = metrics.counter("frames_in_total", "request frames received")
+frames_out = metrics.counter("frames_out_total", "response frames sent")
+bytes_in = metrics.counter("bytes_in_total", "request bytes received (incl. headers)")
+bytes_out = metrics.counter("bytes_out_total", "response bytes sent (incl. headers)")
+command_seconds = metrics.histogram("command_seconds", "time to handle one command", ("cmd",))
+idle_evictions = metrics.counter("idle_evictions_total", "connections closed by the idle timeout")
 
 
 def now_utc_iso():
     return datetime.now(timezone.utc).isoformat()
 
 
+def reply(conn: socket.socket, obj) -> None:
+    frame = encode_frame(obj)
+    conn.sendall(frame)
+    frames_out.inc()
+    bytes_out.inc(len(frame))
+
+
+def read_frame(conn: socket.socket, tracker: IdleTracker):
+    """Next frame as ("json", body bytes) or ("array", decoded typed array)."""
+    length, is_array = recv_header(conn)
+    tracker.touch()
+    frames_in.inc()
+    bytes_in.inc(HEADER_LEN + length)
+    if is_array:
+        typecode, data = recv_array_body(conn, length)
+        return "array", decode_array(typecode, data, np)
+    return "json", recv_exact(conn, length)
+
+
+def read_arrays(conn: socket.socket, n: int, tracker: IdleTracker) -> list:
+    arrays = []
+    for _ in range(n):
+        kind, value = read_frame(conn, tracker)
+        if kind != "array":
+            raise ValueError("expected an array frame")
+        arrays.append(value)
+    return arrays
+
+
+def run_vector(conn: socket.socket, cmd: str, req: dict, tracker: IdleTracker):
+    """Binary vector command.
+
+    {"cmd": c, "arrays": true} is followed by one array frame (two for dot).
+    {"cmd": c, "stream": true} is followed by chunks until an empty array frame;
+    with "partials": true each chunk also gets a running-result reply.
+    """
+    per_step = VECTOR_CMDS[cmd]
+    error = None
+    try:
+        acc = VectorAccumulator(cmd, req.get("bins", 10), req.get("range"))
+    except (TypeError, ValueError) as e:
+        error = ValueError(e)  # still consume the arrays that follow
+    if req.get("stream") and cmd == "histogram" and not req.get("range"):
+        # Later chunks could fall outside a range taken from the first one
+        error = ValueError("histogram over a stream needs an explicit range")
+    if not req.get("stream"):
+        arrays = read_arrays(conn, per_step, tracker)
+        if error:
+            raise error
+        acc.add(*arrays)
+        return acc.result()
+    while True:
+        first = read_arrays(conn, 1, tracker)[0]
+        if not len(first):
+            break
+        arrays = [first] + read_arrays(conn, per_step - 1, tracker)
+        if error:
+            continue  # keep reading to the end marker so the connection stays in sync
+        try:
+            acc.add(*arrays)
+        except ValueError as e:
+            error = e
+            continue
+        if req.get("partials"):
+            reply(conn, {"ok": True, "data": dict(acc.result(), partial=True), "error": None})
+    if error:
+        raise error
+    return acc.result()
+
+
+def evict(conn: socket.socket, addr) -> None:
+    log.info("Idle timeout, closing %s", addr)
+    idle_evictions.inc()
+    try:
+        conn.shutdown(socket.SHUT_RDWR)  # the handler's recv fails and it cleans up as usual
+    except OSError:
+        pass
+
+
 def handle_client(conn: socket.socket, addr):
+    connections_total.inc()
+    connections_open.inc()
+    tracker = IdleTracker(wheel, IDLE_TIMEOUT, lambda: evict(conn, addr))
     with conn:
-        print(f"Client connected: {addr}")
+        log.info("Client connected: %s", addr)
         try:
             while True:
                 try:
-                    req = recv_msg(conn)
+                    kind, body = read_frame(conn, tracker)
                 except ConnectionError:
-                    print(f"Client closed: {addr}")
+                    log.info("Client closed: %s", addr)
                     break
+                t0 = time.perf_counter()
+                if kind == "array":
+                    reply(conn, {"ok": False, "error": "array frame without a command", "data": None})
+                    continue
+                req = json.loads(body)
                 if not isinstance(req, dict):
-                    send_msg(conn, {"ok": False, "error": "Invalid request type", "data": None})
+                    reply(conn, {"ok": False, "error": "Invalid request type", "data": None})
                     continue
                 cmd = str(req.get("cmd", "")).lower()
+                log_sampled(log, logging.DEBUG, LOG_SAMPLE, "cmd %s from %s", cmd, addr)
                 if cmd == "ping":
-                    send_msg(conn, {"ok": True, "data": {"pong": True, "ts": now_utc_iso()}, "error": None})
+                    reply(conn, {"ok": True, "data": {"pong": True, "ts": now_utc_iso()}, "error": None})
                 elif cmd == "echo":
-                    send_msg(conn, {"ok": True, "data": req.get("data"), "error": None})
+                    reply(conn, {"ok": True, "data": req.get("data"), "error": None})
+                elif cmd in VECTOR_CMDS and (req.get("arrays") or req.get("stream")):
+                    try:
+                        reply(conn, {"ok": True, "data": run_vector(conn, cmd, req, tracker), "error": None})
+                    except ValueError as e:
+                        reply(conn, {"ok": False, "data": None, "error": f"{cmd}: {e}"})
                 elif cmd == "sum":
                     nums = req.get("numbers", [])
                     try:
                         total = float(sum(float(x) for x in nums))
-                        send_msg(conn, {"ok": True, "data": {"sum": total}, "error": None})
+                        reply(conn, {"ok": True, "data": {"sum": total}, "error": None})
                     except Exception as e:
-                        send_msg(conn, {"ok": False, "data": None, "error": f"bad numbers: {e}"})
+                        reply(conn, {"ok": False, "data": None, "error": f"bad numbers: {e}"})
+                elif cmd == "stats":
+                    reply(conn, {"ok": True, "data": metrics.snapshot(), "error": None})
                 elif cmd == "quit":
-                    send_msg(conn, {"ok": True, "data": {"bye": True}, "error": None})
+                    reply(conn, {"ok": True, "data": {"bye": True}, "error": None})
                     break
                 else:
-                    send_msg(conn, {"ok": False, "data": None, "error": f"unknown cmd: {cmd}"})
+                    reply(conn, {"ok": False, "data": None, "error": f"unknown cmd: {cmd}"})
+                    cmd = "unknown"  # don't create a label per bogus command name
+                command_seconds.labels(cmd).observe(time.perf_counter() - t0)
         except Exception as e:
-            print(f"Error with {addr}: {e}")
+            log.warning("Error with %s: %s", addr, e)
         finally:
-            print(f"Client disconnected: {addr}")
+            tracker.stop()
+            connections_open.dec()
+            log.info("Client disconnected: %s", addr)
 
 
-def accept_loop():
+def accept_loop(server_sock: socket.socket):
     try:
         while True:
             conn, addr = server_sock.accept()
             threading.Thread(target=handle_client, args=(conn, addr), daemon=True).start()
     except KeyboardInterrupt:
-        print("\nShutting down...")
+        log.info("\nShutting down...")
     finally:
         server_sock.close()
 
 
+def main():
+    global LOG_SAMPLE, IDLE_TIMEOUT
+    ap = argparse.ArgumentParser(description="Request/response RPC server")
+    ap.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus text on :PORT/metrics")
+    ap.add_argument("--log-level", default="INFO", help="DEBUG shows sampled per-command lines")
+    ap.add_argument("--log-sample", type=float, default=LOG_SAMPLE, help="fraction of per-command lines kept")
+    ap.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                    help="close connections with no frames for this many seconds (0 = never)")
+    args = ap.parse_args()
+    setup_logging(args.log_level)
+    LOG_SAMPLE, IDLE_TIMEOUT = args.log_sample, args.idle_timeout
+
+    log.info("Starting RPC server on %s:%s ...", HOST, PORT)
+    server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_sock.bind((HOST, PORT))
+    server_sock.listen(50)
+    if args.metrics_port:
+        serve_http(metrics, args.metrics_port)
+        log.info("Metrics on http://%s:%s/metrics", HOST, args.metrics_port)
+    log.info("Server listening; press Ctrl+C to stop.")
+    accept_loop(server_sock)
+
+
 if __name__ == "__main__":
-    accept_loop()
+    main()
@@ -0,0 +1,135 @@
+"""Hashed timer wheel plus per-connection idle tracking for the socket servers.
+
+The wheel has a fixed number of slots, and a timer goes into the slot that
+matches its deadline. Each tick looks at a single slot only, so the cost of a
+tick does not grow with the total number of connections. Delays longer than
+one turn of the wheel wait in their slot for extra rounds.
+
+IdleTracker does not reschedule on every frame. touch() only stamps the
+time. When the timer fires, the tracker checks how long the connection has
+been idle: it sends a heartbeat ping, evicts the connection, or schedules
+the next check for the remaining time.
+"""
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+class Timer:
+    __slots__ = ("callback", "slot", "rounds")
+
+    def __init__(self, callback: Callable[[], None], slot: int, rounds: int):
+        self.callback = callback
+        self.slot = slot
+        self.rounds = rounds
+
+
+class TimerWheel:
+    def __init__(self, tick: float = 1.0, slots: int = 512):
+        self.tick = tick
+        self.slots: List[Dict[Timer, None]] = [{} for _ in range(slots)]  # dicts as O(1) ordered sets
+        self.cursor = 0
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.thread = None  # started on first schedule(), so it also works in forked workers
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> Timer:
+        ticks = max(1, math.ceil(delay / self.tick))
+        n = len(self.slots)
+        with self.lock:
+            slot = (self.cursor + ticks) % n
+            timer = Timer(callback, slot, (ticks - 1) // n)
+            self.slots[slot][timer] = None
+            self.pending += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        return timer
+
+    def cancel(self, timer: Optional[Timer]) -> None:
+        if timer is None:
+            return
+        with self.lock:
+            if self.slots[timer.slot].pop(timer, 0) is None:
+                self.pending -= 1
+
+    def _advance(self) -> List[Timer]:
+        with self.lock:
+            self.cursor = (self.cursor + 1) % len(self.slots)
+            slot = self.slots[self.cursor]
+            due = []
+            for timer in slot:
+                if timer.rounds:
+                    timer.rounds -= 1
+                else:
+                    due.append(timer)
+            for timer in due:
+                del slot[timer]
+            self.pending -= len(due)
+        return due
+
+    def _run(self) -> None:
+        next_tick = time.monotonic() + self.tick
+        while True:
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_tick += self.tick
+            # Callbacks run outside the lock and may schedule new timers
+            for timer in self._advance():
+                try:
+                    timer.callback()
+                except Exception:
+                    pass
+
+
+class IdleTracker:
+    """Heartbeat and idle-eviction state for one connection.
+
+    send_ping (optional) is called once the peer has been quiet for
+    `heartbeat` seconds. evict is called after `idle_timeout` seconds
+    without any frame from the peer. Either can be 0 (off) independently.
+    Both run on the wheel thread and must not block.
+    """
+
+    def __init__(self, wheel: TimerWheel, idle_timeout: float, evict: Callable[[], None],
+                 heartbeat: float = 0, send_ping: Callable[[], None] = None):
+        self.wheel = wheel
+        self.idle_timeout = max(idle_timeout, 0)
+        self.heartbeat = max(heartbeat, 0) if send_ping else 0
+        self.evict = evict
+        self.send_ping = send_ping
+        self.last_seen = time.monotonic()
+        self.timer = None
+        self.stopped = False
+        if self.heartbeat or self.idle_timeout:
+            self._schedule(self._interval())
+
+    def _interval(self) -> float:
+        return min(t for t in (self.heartbeat, self.idle_timeout) if t)
+
+    def touch(self) -> None:
+        self.last_seen = time.monotonic()
+
+    def _schedule(self, delay: float) -> None:
+        if not self.stopped:
+            self.timer = self.wheel.schedule(delay, self._check)
+
+    def _check(self) -> None:
+        if self.stopped:
+            return
+        idle = time.monotonic() - self.last_seen
+        if self.idle_timeout and idle >= self.idle_timeout:
+            self.stopped = True
+            self.evict()
+            return
+        if self.heartbeat and idle >= self.heartbeat:
+            self.send_ping()
+            self._schedule(min(self.heartbeat, self.idle_timeout - idle) if self.idle_timeout else self.heartbeat)
+        else:
+            self._schedule(self._interval() - idle)
+
+    def stop(self) -> None:
+        self.stopped = True
+        self.wheel.cancel(self.timer)
@@ -0,0 +1,99 @@
+"""Vectorized sum/mean/dot/histogram over typed-array frames for server.py.
+
+Uses NumPy when it is installed and falls back to the standard library
+otherwise. Either way the input is the zero-copy view from
+common.decode_array. Results accumulate chunk by chunk, so a streamed
+request gives the same answer as a single frame.
+"""
+import math
+import operator
+
+try:
+    import numpy as np
+except ImportError:  # pure-Python fallback
+    np = None
+
+VECTOR_CMDS = {"sum": 1, "mean": 1, "dot": 2, "histogram": 1}  # cmd -> arrays per step
+
+
+def _is_float(a) -> bool:
+    if np is not None:
+        return a.dtype.kind == "f"
+    return getattr(a, "format", None) in ("f", "d") or getattr(a, "typecode", None) in ("f", "d")
+
+
+class VectorAccumulator:
+    """Running result of one vector command; add() once per frame (or per x/y pair for dot)."""
+
+    def __init__(self, cmd: str, bins: int = 10, range=None):
+        self.cmd = cmd
+        self.count = 0
+        self.chunks = 0
+        self.total = 0        # exact int for integer input, float otherwise
+        self.bins = int(bins)
+        self.range = tuple(float(v) for v in range) if range else None
+        self.range_explicit = self.range is not None  # otherwise the first frame sets it
+        self.hist = [0] * self.bins
+        if cmd == "histogram" and self.bins <= 0:
+            raise ValueError("bins must be positive")
+
+    def add(self, *arrays) -> None:
+        a = arrays[0]
+        if self.cmd == "dot":
+            b = arrays[1]
+            if len(a) != len(b):
+                raise ValueError(f"length mismatch {len(a)} != {len(b)}")
+            self.total += self._dot(a, b)
+        elif self.cmd == "histogram":
+            self._histogram(a)
+        else:
+            self.total += self._sum(a)
+        self.count += len(a)
+        self.chunks += 1
+
+    @staticmethod
+    def _sum(a):
+        if np is not None:
+            return a.sum(dtype=np.float64 if _is_float(a) else np.int64).item()
+        return math.fsum(a) if _is_float(a) else sum(a)
+
+    @staticmethod
+    def _dot(a, b):
+        if np is not None:
+            if _is_float(a) or _is_float(b):
+                return float(np.dot(a.astype(np.float64, copy=False), b.astype(np.float64, copy=False)))
+            return int(np.dot(a.astype(np.int64, copy=False), b.astype(np.int64, copy=False)))
+        products = map(operator.mul, a, b)
+        return math.fsum(products) if _is_float(a) or _is_float(b) else sum(products)
+
+    def _histogram(self, a) -> None:
+        if not len(a):
+            return
+        if not self.range_explicit and self.chunks:
+            # A single frame can take its own range; chunks of a stream must share one
+            raise ValueError("histogram over a stream needs an explicit range")
+        if self.range is None:
+            self.range = (float(min(a)), float(max(a))) if np is None else (float(a.min()), float(a.max()))
+        lo, hi = self.range
+        if np is not None:
+            counts, _ = np.histogram(a, bins=self.bins, range=(lo, hi))
+            self.hist = [h + int(c) for h, c in zip(self.hist, counts)]
+            return
+        width = (hi - lo) / self.bins or 1.0
+        last = self.bins - 1
+        for v in a:
+            if lo <= v <= hi:  # same edges as np.histogram: the last bin includes hi
+                self.hist[min(int((v - lo) / width), last)] += 1
+
+    def result(self) -> dict:
+        out = {"count": self.count, "chunks": self.chunks}
+        if self.cmd == "histogram":
+            lo, hi = self.range or (0.0, 0.0)
+            step = (hi - lo) / self.bins
+            out["counts"] = self.hist
+            out["edges"] = [lo + i * step for i in range(self.bins)] + [hi]
+        elif self.cmd == "mean":
+            out["mean"] = self.total / self.count if self.count else None
+        else:
+            out[self.cmd] = self.total
+        return out
@@ -0,0 +1,324 @@
+"""Load generator for the ipc_demo servers.
+
+Runs N concurrent simulated clients against the TCP, UDP, RPC or DSM demo on
+localhost. Reports throughput and p50/p90/p99/p99.9 latency and can write the
+results as JSON.
+
+    python bench.py tcp --clients 32 --duration 10
+    python bench.py udp --spawn --server-args "--log off" --json udp.json
+    python bench.py rpc --clients 8 --size 1024
+    python bench.py rpc --transport shm --spawn
+    python bench.py dsm --server-pid 1234
+
+With --spawn (or --server-pid) the server's CPU and RSS are sampled as well.
+That uses psutil when installed, otherwise /proc (Linux).
+"""
+import argparse
+import json
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HOST = "127.0.0.1"
+PORTS = {"tcp": 13000, "udp": 13001, "dsm": 13002, "rpc": 13003}
+SERVERS = {"tcp": "tcp_server.py", "udp": "udp_server.py", "rpc": "rpc_server.py", "dsm": "dsm_server.py"}
+counters_lock = threading.Lock()
+
+
+class Histogram:
+    """HDR-style log-linear histogram of integer values (nanoseconds here).
+
+    Each power-of-two range is split into 2**sub_bits linear buckets, so any
+    recorded value is reported within ~1/2**(sub_bits-1) relative error.
+    """
+
+    def __init__(self, sub_bits: int = 7):
+        self.sub_bits = sub_bits
+        self.counts = defaultdict(int)
+        self.total = 0
+        self.sum = 0
+        self.max = 0
+
+    def record(self, value: int) -> None:
+        shift = max(0, value.bit_length() - self.sub_bits)
+        self.counts[(shift, value >> shift)] += 1
+        self.total += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram") -> None:
+        for k, c in other.counts.items():
+            self.counts[k] += c
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def percentiles(self, qs):
+        out = {}
+        if not self.total:
+            return {q: 0 for q in qs}
+        buckets = sorted(self.counts.items(), key=lambda kv: kv[0][1] << kv[0][0])
+        targets = sorted(qs)
+        seen, i = 0, 0
+        for (shift, m), c in buckets:
+            seen += c
+            while i < len(targets) and seen >= targets[i] / 100.0 * self.total:
+                lo, hi = m << shift, ((m + 1) << shift) - 1
+                out[targets[i]] = min((lo + hi) / 2, self.max)
+                i += 1
+        for q in targets[i:]:
+            out[q] = self.max
+        return out
+
+
+# --- per-target client factories: each returns (op, close) for one simulated client ---
+
+def make_tcp(args):
+    sock = socket.create_connection((HOST, args.port), timeout=args.timeout)
+    payload = b"x" * args.size
+    expect = len(b"echo: ") + args.size
+    buf = bytearray(expect)
+    view = memoryview(buf)
+
+    def op():
+        # Keep --size under the server's read size (4096) so each send is echoed with one prefix.
+        sock.sendall(payload)
+        got = 0
+        while got < expect:
+            n = sock.recv_into(view[got:])
+            if not n:
+                raise ConnectionError("server closed")
+            got += n
+    return op, sock.close
+
+
+def make_udp(args):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(args.timeout)
+    sock.connect((HOST, args.port))
+    payload = b"x" * args.size
+    buf = bytearray(65535)
+
+    def op():
+        sock.send(payload)
+        sock.recv_into(buf)
+    return op, sock.close
+
+
+def make_rpc(args):
+    sys.path.insert(0, HERE)
+    from rpc_client import RPCClient
+    cli = RPCClient(port=args.port, timeout=args.timeout, transport=args.transport)
+    payload = "x" * args.size
+
+    def op():
+        resp = cli.call("echo", payload)
+        if not resp.get("ok"):
+            raise RuntimeError(resp.get("error"))
+    return op, cli.close
+
+
+def make_dsm(args):
+    from multiprocessing.managers import BaseManager
+
+    class DSMManager(BaseManager):
+        pass
+
+    DSMManager.register('state')
+    mgr = DSMManager(address=(HOST, args.port), authkey=b'secret')
+    mgr.connect()
+    state = mgr.state()
+
+    def op():
+        state.inc(1)
+    return op, lambda: None
+
+
+TARGETS = {"tcp": make_tcp, "udp": make_udp, "rpc": make_rpc, "dsm": make_dsm}
+
+
+# --- server resource sampling ---
+
+class ProcSampler(threading.Thread):
+    def __init__(self, pid: int, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.pid, self.interval = pid, interval
+        self.stop_event = threading.Event()
+        self.cpu = []
+        self.rss_peak = 0
+        try:
+            import psutil
+            self.proc = psutil.Process(pid)
+        except ImportError:
+            self.proc = None
+
+    def _cpu_seconds(self) -> float:
+        if self.proc is not None:
+            t = self.proc.cpu_times()
+            return t.user + t.system
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def _rss(self) -> int:
+        if self.proc is not None:
+            return self.proc.memory_info().rss
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    def run(self):
+        try:
+            last_cpu, last_t = self._cpu_seconds(), time.perf_counter()
+            while not self.stop_event.wait(self.interval):
+                cpu, now = self._cpu_seconds(), time.perf_counter()
+                self.cpu.append(100.0 * (cpu - last_cpu) / (now - last_t))
+                last_cpu, last_t = cpu, now
+                self.rss_peak = max(self.rss_peak, self._rss())
+        except (OSError, ValueError, ImportError) as e:
+            print(f"server sampling stopped: {e}", file=sys.stderr)
+
+    def summary(self) -> dict:
+        self.stop_event.set()
+        self.join(timeout=2)
+        return {
+            "pid": self.pid,
+            "cpu_percent_avg": round(sum(self.cpu) / len(self.cpu), 1) if self.cpu else None,
+            "cpu_percent_max": round(max(self.cpu), 1) if self.cpu else None,
+            "rss_peak_bytes": self.rss_peak or None,
+        }
+
+
+def run_client(factory, args, start_at, stop_at, hist, counters):
+    try:
+        op, close = factory(args)
+    except Exception as e:
+        with counters_lock:
+            counters["connect_errors"] += 1
+        print(f"client setup failed: {e}", file=sys.stderr)
+        return
+    done, errors = 0, 0
+    clock = time.perf_counter_ns
+    try:
+        while time.perf_counter() < start_at:  # warmup, not recorded
+            op()
+        while True:
+            t0 = clock()
+            if t0 >= stop_at or (args.requests and done >= args.requests):
+                break
+            try:
+                op()
+            except (socket.timeout, TimeoutError):
+                errors += 1
+                # The late reply would be read as the next request's answer: start over on a new connection.
+                close()
+                close = lambda: None
+                op, close = factory(args)
+                continue
+            hist.record(clock() - t0)
+            done += 1
+    except Exception as e:
+        errors += 1
+        print(f"client stopped: {e}", file=sys.stderr)
+    finally:
+        close()
+        with counters_lock:
+            counters["errors"] += errors
+
+
+def main():
+    ap = argparse.ArgumentParser(description="ipc_demo load generator")
+    ap.add_argument("target", choices=sorted(TARGETS))
+    ap.add_argument("--clients", type=int, default=8)
+    ap.add_argument("--duration", type=float, default=5.0, help="measured seconds (after warmup)")
+    ap.add_argument("--warmup", type=float, default=1.0)
+    ap.add_argument("--requests", type=int, default=0, help="stop each client after N requests")
+    ap.add_argument("--size", type=int, default=64, help="payload bytes (tcp/udp/rpc)")
+    ap.add_argument("--port", type=int, default=None)
+    ap.add_argument("--transport", choices=["tcp", "unix", "shm"], default="tcp",
+                    help="rpc only; unix needs the server started with --unix")
+    ap.add_argument("--timeout", type=float, default=5.0)
+    ap.add_argument("--spawn", action="store_true", help="start the target's server script for the run")
+    ap.add_argument("--server-args", default="", help="extra arguments for --spawn")
+    ap.add_argument("--server-pid", type=int, default=None, help="sample CPU/RSS of an already running server")
+    ap.add_argument("--json", default=None, help="write results to this file")
+    args = ap.parse_args()
+    args.port = args.port or PORTS[args.target]
+
+    server = None
+    if args.spawn:
+        cmd = [sys.executable, os.path.join(HERE, SERVERS[args.target])] + shlex.split(args.server_args)
+        server = subprocess.Popen(cmd, cwd=HERE, stdout=subprocess.DEVNULL)
+        time.sleep(1.0)
+        args.server_pid = server.pid
+    sampler = ProcSampler(args.server_pid) if args.server_pid else None
+
+    hists = [Histogram() for _ in range(args.clients)]
+    counters = defaultdict(int)
+    start_at = time.perf_counter() + args.warmup
+    stop_at = time.perf_counter_ns() + int((args.warmup + args.duration) * 1e9)
+    threads = [threading.Thread(target=run_client, daemon=True,
+                                args=(TARGETS[args.target], args, start_at, stop_at, h, counters))
+               for h in hists]
+    try:
+        for t in threads:
+            t.start()
+        while time.perf_counter() < start_at:
+            time.sleep(0.01)
+        if sampler:
+            sampler.start()
+        t_begin = time.perf_counter()
+        for t in threads:
+            t.join()
+        elapsed = max(time.perf_counter() - t_begin, 1e-9)
+    finally:
+        server_stats = sampler.summary() if sampler else None
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=5)
+
+    total = Histogram()
+    for h in hists:
+        total.merge(h)
+    pct = total.percentiles([50, 90, 99, 99.9])
+    result = {
+        "target": args.target,
+        "clients": args.clients,
+        "size": args.size,
+        "elapsed_s": round(elapsed, 3),
+        "requests": total.total,
+        "errors": counters["errors"],
+        "connect_errors": counters["connect_errors"],
+        "throughput_rps": round(total.total / elapsed, 1),
+        "latency_us": {
+            "mean": round(total.sum / total.total / 1e3, 1) if total.total else 0,
+            "p50": round(pct[50] / 1e3, 1),
+            "p90": round(pct[90] / 1e3, 1),
+            "p99": round(pct[99] / 1e3, 1),
+            "p99.9": round(pct[99.9] / 1e3, 1),
+            "max": round(total.max / 1e3, 1),
+        },
+        "server": server_stats,
+    }
+    lat = result["latency_us"]
+    print(f"{args.target}: {result['requests']} req in {result['elapsed_s']}s "
+          f"= {result['throughput_rps']:,.0f} req/s, errors={result['errors']}")
+    print(f"latency us: p50={lat['p50']} p90={lat['p90']} p99={lat['p99']} p99.9={lat['p99.9']} max={lat['max']}")
+    if server_stats:
+        print(f"server: cpu avg={server_stats['cpu_percent_avg']}% rss peak={server_stats['rss_peak_bytes']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import argparse
 from multiprocessing.managers import BaseManager
 from datetime import datetime
 
@@ -7,12 +8,21 @@ class DSMManager(BaseManager):
 DSMManager.register('state')  # same name as server registration
 
 if __name__ == "__main__":
-    mgr = DSMManager(address=("127.0.0.1", 13002), authkey=b'secret')
-    mgr.connect()
-    state = mgr.state()  # proxy
+    ap = argparse.ArgumentParser(description="DSM client")
+    ap.add_argument("--backend", choices=["manager", "shm"], default="manager")
+    args = ap.parse_args()
+    if args.backend == "shm":
+        from dsm_shm import ShmSharedState
+        state = ShmSharedState()  # attaches to the server's segment
+    else:
+        mgr = DSMManager(address=("127.0.0.1", 13002), authkey=b'secret')
+        mgr.connect()
+        state = mgr.state()  # proxy
     now = datetime.now().isoformat()
     new_count = state.inc(1)
-    state.append(f"client update at {now}")
-    snapshot = state.get()
+    version = state.append(f"client update at {now}")
+    delta = state.get_since(version - 1)  # only what this client just added
     print("Counter:", new_count)
-    print("Snapshot:", snapshot)
+    print("Delta:", delta)
+    if args.backend == "shm":
+        state.close()
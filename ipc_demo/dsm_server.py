@@ -1,29 +1,77 @@
+import argparse
+import threading
 from multiprocessing.managers import BaseManager
 from dataclasses import dataclass
 from typing import Any
 
 class SharedState:
-    def __init__(self) -> None:
+    """Counter plus an append-only message log.
+
+    version is the number of messages ever appended; get_since(v) returns only
+    the messages after v. Only the newest `retention` messages are kept: the log
+    is compacted once it reaches twice that, so memory stays flat on long runs.
+    """
+    def __init__(self, retention: int = 10000) -> None:
         self.counter = 0
         self.messages = []
+        self.version = 0
+        self.base = 0  # version just before messages[0]
+        self.retention = retention
+        self.lock = threading.Lock()
     def inc(self, n: int = 1) -> int:
-        self.counter += int(n)
-        return self.counter
+        with self.lock:
+            self.counter += int(n)
+            return self.counter
     def append(self, msg: Any) -> int:
-        self.messages.append(str(msg))
-        return len(self.messages)
+        with self.lock:
+            self.messages.append(str(msg))
+            self.version += 1
+            if len(self.messages) >= 2 * self.retention:
+                drop = len(self.messages) - self.retention
+                del self.messages[:drop]
+                self.base += drop
+            return self.version
     def get(self) -> dict:
-        return {"counter": self.counter, "messages": list(self.messages)}
+        with self.lock:
+            return {"counter": self.counter, "messages": list(self.messages), "version": self.version}
+    def get_since(self, version: int = 0) -> dict:
+        """truncated is True when messages after `version` were already compacted away."""
+        version = int(version)
+        with self.lock:
+            start = max(version - self.base, 0)
+            return {
+                "counter": self.counter,
+                "messages": self.messages[start:],
+                "version": self.version,
+                "truncated": version < self.base,
+            }
 
 _state = SharedState()
 
 class DSMManager(BaseManager):
     pass
 
-DSMManager.register('state', callable=lambda: _state, exposed=['inc','append','get'])
+DSMManager.register('state', callable=lambda: _state, exposed=['inc','append','get','get_since'])
+
+def serve_shm():
+    from dsm_shm import ShmSharedState, SHM_NAME
+    state = ShmSharedState(create=True)
+    print(f"DSM shared-memory segment '{SHM_NAME}' ready (same-host clients: dsm_client.py --backend shm)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        state.close()
 
 if __name__ == "__main__":
-    print("DSM server on 127.0.0.1:13002 (authkey=b'secret')")
-    mgr = DSMManager(address=("127.0.0.1", 13002), authkey=b'secret')
-    srv = mgr.get_server()
-    srv.serve_forever()
+    ap = argparse.ArgumentParser(description="DSM server")
+    ap.add_argument("--backend", choices=["manager", "shm"], default="manager")
+    args = ap.parse_args()
+    if args.backend == "shm":
+        serve_shm()
+    else:
+        print("DSM server on 127.0.0.1:13002 (authkey=b'secret')")
+        mgr = DSMManager(address=("127.0.0.1", 13002), authkey=b'secret')
+        srv = mgr.get_server()
+        srv.serve_forever()
@@ -0,0 +1,86 @@
+import argparse
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from multiprocessing.managers import BaseManager
+from typing import Any, Dict, Iterable
+
+HOST = "127.0.0.1"
+BASE_PORT = 13010
+AUTHKEY = b'secret'
+
+class DSMManager(BaseManager):
+    pass
+
+DSMManager.register('keyed')  # same name as server registration
+
+
+class ShardedDSM:
+    """Routes keys to shards by a stable hash (crc32) so every client agrees on placement.
+
+    multi_inc/multi_get group keys by shard and send one call per shard, in parallel.
+    """
+    def __init__(self, shards: int = 4, host: str = HOST, base_port: int = BASE_PORT) -> None:
+        self.proxies = []
+        for i in range(shards):
+            mgr = DSMManager(address=(host, base_port + i), authkey=AUTHKEY)
+            mgr.connect()
+            self.proxies.append(mgr.keyed())
+        # Proxies open one connection per calling thread; a fixed pool keeps them reused.
+        self.pool = ThreadPoolExecutor(max_workers=shards, thread_name_prefix="dsm-shard")
+
+    def shard_of(self, key: str) -> int:
+        return zlib.crc32(key.encode("utf-8")) % len(self.proxies)
+
+    def inc(self, key: str, n: int = 1) -> int:
+        return self.proxies[self.shard_of(key)].inc(key, n)
+
+    def append(self, key: str, msg: Any) -> int:
+        return self.proxies[self.shard_of(key)].append(key, msg)
+
+    def get(self, key: str) -> dict:
+        return self.proxies[self.shard_of(key)].get(key)
+
+    def get_since(self, key: str, version: int = 0) -> dict:
+        return self.proxies[self.shard_of(key)].get_since(key, version)
+
+    def _fan_out(self, method: str, groups: Dict[int, Any]) -> dict:
+        if len(groups) == 1:
+            (idx, arg), = groups.items()
+            return getattr(self.proxies[idx], method)(arg)
+        futures = [self.pool.submit(getattr(self.proxies[idx], method), arg) for idx, arg in groups.items()]
+        out = {}
+        for f in futures:
+            out.update(f.result())
+        return out
+
+    def multi_inc(self, deltas: Dict[str, int]) -> Dict[str, int]:
+        groups = defaultdict(dict)
+        for k, n in deltas.items():
+            groups[self.shard_of(k)][k] = n
+        return self._fan_out("multi_inc", groups)
+
+    def multi_get(self, keys: Iterable[str]) -> Dict[str, dict]:
+        groups = defaultdict(list)
+        for k in keys:
+            groups[self.shard_of(k)].append(k)
+        return self._fan_out("multi_get", groups)
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Sharded keyed DSM client demo")
+    ap.add_argument("--shards", type=int, default=4)
+    ap.add_argument("--host", default=HOST)
+    ap.add_argument("--base-port", type=int, default=BASE_PORT, help="port of shard 0 (as given to the server)")
+    args = ap.parse_args()
+    dsm = ShardedDSM(args.shards, args.host, args.base_port)
+    keys = [f"room:{i}" for i in range(8)]
+    print("multi_inc:", dsm.multi_inc({k: 1 for k in keys}))
+    dsm.append("room:0", f"client update at {datetime.now().isoformat()}")
+    print("room:0 ->", dsm.get("room:0"))
+    print("placement:", {k: dsm.shard_of(k) for k in keys})
+    dsm.close()
@@ -0,0 +1,85 @@
+import argparse
+import signal
+import sys
+import threading
+from multiprocessing import Process
+from multiprocessing.managers import BaseManager
+from typing import Any, Dict, Iterable
+from dsm_server import SharedState
+
+HOST = "127.0.0.1"
+BASE_PORT = 13010  # shard i listens on BASE_PORT + i
+AUTHKEY = b'secret'
+
+
+class KeyedState:
+    """Named counters/logs for one shard; each key is an independent SharedState.
+
+    Entries are created by inc/append only. Reading a key that was never
+    written returns an empty snapshot, so reads can't grow the shard.
+    """
+    _EMPTY = SharedState()  # never written; stands in for unknown keys on reads
+    def __init__(self) -> None:
+        self.keys: Dict[str, SharedState] = {}
+        self.lock = threading.Lock()
+    def _entry(self, key: str) -> SharedState:
+        st = self.keys.get(key)
+        if st is None:
+            with self.lock:
+                st = self.keys.setdefault(key, SharedState())
+        return st
+    def _lookup(self, key: str) -> SharedState:
+        return self.keys.get(key, self._EMPTY)
+    def inc(self, key: str, n: int = 1) -> int:
+        return self._entry(key).inc(n)
+    def append(self, key: str, msg: Any) -> int:
+        return self._entry(key).append(msg)
+    def get(self, key: str) -> dict:
+        return self._lookup(key).get()
+    def get_since(self, key: str, version: int = 0) -> dict:
+        return self._lookup(key).get_since(version)
+    def multi_inc(self, deltas: Dict[str, int]) -> Dict[str, int]:
+        return {k: self._entry(k).inc(n) for k, n in deltas.items()}
+    def multi_get(self, keys: Iterable[str]) -> Dict[str, dict]:
+        return {k: self._lookup(k).get() for k in keys}
+    def stats(self) -> dict:
+        return {"keys": len(self.keys)}
+
+_keyed = KeyedState()
+
+class DSMManager(BaseManager):
+    pass
+
+DSMManager.register('keyed', callable=lambda: _keyed,
+                    exposed=['inc', 'append', 'get', 'get_since', 'multi_inc', 'multi_get', 'stats'])
+
+
+def serve_shard(index: int, base_port: int = BASE_PORT) -> None:
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    mgr = DSMManager(address=(HOST, base_port + index), authkey=AUTHKEY)
+    srv = mgr.get_server()
+    print(f"DSM shard {index} on {HOST}:{base_port + index}", flush=True)
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Sharded keyed DSM server")
+    ap.add_argument("--shards", type=int, default=4)
+    ap.add_argument("--base-port", type=int, default=BASE_PORT)
+    args = ap.parse_args()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # run the cleanup below
+    procs = [Process(target=serve_shard, args=(i, args.base_port), daemon=True) for i in range(args.shards)]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            p.terminate()
+            p.join(timeout=2)
@@ -0,0 +1,143 @@
+"""Same-host DSM backend on multiprocessing.shared_memory.
+
+Same inc/append/get/get_since interface as SharedState in dsm_server.py, but
+operations touch a shared segment directly instead of making a Manager proxy
+round trip.
+
+Layout: header (counter, total appended, capacity, slot size) followed by a
+ring of fixed-size message slots, each a 4-byte length plus UTF-8 bytes.
+A message may use at most slot_size - 4 bytes once encoded (max_message);
+append() raises ValueError for longer ones rather than cutting them. The
+ring keeps the newest `capacity` messages.
+"""
+import os
+import struct
+import tempfile
+import threading
+from multiprocessing import shared_memory
+from typing import Any
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+SHM_NAME = "ipc_demo_dsm"
+HEADER = struct.Struct("<qqqq")  # counter, total, capacity, slot_size
+SLOT_LEN = struct.Struct("<I")
+
+
+class _FileLock:
+    """Cross-process lock usable by unrelated processes (advisory lock on a file)."""
+
+    def __init__(self, path: str):
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self.local = threading.Lock()  # flock is per file description, so guard our own threads too
+
+    def __enter__(self):
+        self.local.acquire()
+        if fcntl:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        else:
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            msvcrt.locking(self.fd, msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        self.local.release()
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        # Older versions register attached segments too and unlink them when this
+        # process exits; only the creating server should do that.
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+
+class ShmSharedState:
+    def __init__(self, name: str = SHM_NAME, create: bool = False, capacity: int = 1024,
+                 slot_size: int = 256, lock=None) -> None:
+        if create:
+            size = HEADER.size + capacity * slot_size
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:  # left behind by a server that was killed
+                stale = _attach(name)
+                stale.close()
+                stale.unlink()
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            HEADER.pack_into(self.shm.buf, 0, 0, 0, capacity, slot_size)
+        else:
+            self.shm = _attach(name)
+        self.owner = create
+        self.buf = self.shm.buf
+        _, _, self.capacity, self.slot_size = HEADER.unpack_from(self.buf, 0)
+        self.max_message = self.slot_size - SLOT_LEN.size
+        self._own_lock = lock is None
+        self.lock = lock or _FileLock(os.path.join(tempfile.gettempdir(), f"{name}.lock"))
+
+    def inc(self, n: int = 1) -> int:
+        with self.lock:
+            counter = struct.unpack_from("<q", self.buf, 0)[0] + int(n)
+            struct.pack_into("<q", self.buf, 0, counter)
+        return counter
+
+    def append(self, msg: Any) -> int:
+        data = str(msg).encode("utf-8")
+        if len(data) > self.max_message:
+            raise ValueError(f"message is {len(data)} bytes encoded; slots hold at most {self.max_message}")
+        with self.lock:
+            total = struct.unpack_from("<q", self.buf, 8)[0]
+            off = HEADER.size + (total % self.capacity) * self.slot_size
+            SLOT_LEN.pack_into(self.buf, off, len(data))
+            self.buf[off + SLOT_LEN.size: off + SLOT_LEN.size + len(data)] = data
+            struct.pack_into("<q", self.buf, 8, total + 1)
+        return total + 1
+
+    def get(self) -> dict:
+        snap = self.get_since(0)
+        del snap["truncated"]
+        return snap
+
+    def get_since(self, version: int = 0) -> dict:
+        """version is the total appended count; the ring only holds the newest `capacity`."""
+        version = int(version)
+        with self.lock:
+            counter, total = struct.unpack_from("<qq", self.buf, 0)
+            oldest = max(0, total - self.capacity)
+            raw = []
+            for seq in range(max(version, oldest), total):
+                off = HEADER.size + (seq % self.capacity) * self.slot_size
+                (length,) = SLOT_LEN.unpack_from(self.buf, off)
+                raw.append(bytes(self.buf[off + SLOT_LEN.size: off + SLOT_LEN.size + length]))
+        return {
+            "counter": counter,
+            "messages": [m.decode("utf-8", "replace") for m in raw],
+            "version": total,
+            "truncated": version < oldest,
+        }
+
+    def close(self) -> None:
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        if self._own_lock:
+            self.lock.close()
@@ -1,6 +1,9 @@
 import socket
 import sys
-from rpc_common import send_msg, recv_msg
+import threading
+from concurrent.futures import Future
+from rpc_common import send_msg, recv_msg, send_stream
+from rpc_transport import UNIX_PATH, ShmChannel, connect_unix
 
 HOST = "127.0.0.1"
 PORT = 13003
@@ -12,12 +15,120 @@ def rpc_call(name, *args, **kwargs):
         return recv_msg(s)
 
 
+class RPCClient:
+    """Persistent RPC connection.
+
+    With batch_window > 0, calls made from any thread within that many seconds
+    of each other are coalesced into a single batch frame (one round trip).
+
+    transport: "tcp", "unix" (server started with --unix) or "shm" (shared-memory
+    rings negotiated over a TCP connection; same host only).
+    """
+
+    def __init__(self, host=HOST, port=PORT, timeout=5, batch_window=0.0, max_batch=256,
+                 transport="tcp", unix_path=UNIX_PATH):
+        if transport == "unix":
+            self.sock = connect_unix(unix_path, timeout=timeout)
+        elif transport == "shm":
+            control = socket.create_connection((host, port), timeout=timeout)
+            chan = ShmChannel.create(control=control, timeout=timeout)
+            try:
+                send_msg(control, {"transport": "shm", "name": chan.name})
+                resp = recv_msg(control)
+                if not resp.get("ok"):
+                    raise ConnectionError(resp.get("error"))
+            except Exception:
+                chan.close()
+                raise
+            self.sock = chan
+        elif transport == "tcp":
+            self.sock = socket.create_connection((host, port), timeout=timeout)
+        else:
+            raise ValueError(f"unknown transport: {transport}")
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._io_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending = []  # [(request, Future)]
+        self._timer = None
+
+    def _roundtrip(self, req):
+        with self._io_lock:
+            send_msg(self.sock, req)
+            return recv_msg(self.sock)
+
+    def call(self, name, *args, **kwargs):
+        req = {"call": name, "args": list(args), "kwargs": kwargs}
+        if self.batch_window <= 0:
+            return self._roundtrip(req)
+        fut = Future()
+        flush_now = False
+        with self._pending_lock:
+            self._pending.append((req, fut))
+            if len(self._pending) >= self.max_batch:
+                flush_now = True
+            elif self._timer is None:
+                self._timer = threading.Timer(self.batch_window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if flush_now:
+            self.flush()
+        return fut.result()
+
+    def batch(self, calls, parallel=False):
+        """calls: iterable of (name, args, kwargs); returns one response per call."""
+        frame = [{"call": n, "args": list(a), "kwargs": dict(k)} for n, a, k in calls]
+        resp = self._roundtrip({"batch": frame, "parallel": parallel})
+        if not resp.get("ok"):
+            raise RuntimeError(resp.get("error"))
+        return resp["data"]
+
+    def call_stream(self, name, chunks, *args, **kwargs):
+        """Send an iterable of bytes-like chunks to a server stream function."""
+        with self._io_lock:
+            send_msg(self.sock, {"call": name, "stream": True, "args": list(args), "kwargs": kwargs})
+            send_stream(self.sock, chunks)
+            return recv_msg(self.sock)
+
+    def flush(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return
+        try:
+            resp = self._roundtrip({"batch": [r for r, _ in pending]})
+            if not resp.get("ok"):
+                raise RuntimeError(resp.get("error"))
+            for (_, fut), res in zip(pending, resp["data"]):
+                fut.set_result(res)
+        except Exception as e:
+            for _, fut in pending:
+                if not fut.done():
+                    fut.set_exception(e)
+
+    def close(self):
+        self.flush()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
 if __name__ == "__main__":
     # Demo
     print("add ->", rpc_call("add", 2, 3))
     print("mul ->", rpc_call("mul", 6, 7))
     print("echo ->", rpc_call("echo", {"hello": "world"}))
     print("time ->", rpc_call("time"))
+    with RPCClient() as cli:
+        print("batch ->", cli.batch([("add", (1, 2), {}), ("mul", (3, 4), {}), ("nope", (), {})]))
+        print("sha256 (stream) ->", cli.call_stream("sha256", (b"x" * 65536 for _ in range(64))))
 
     # Interactive
     print("Type: call <name> [args...] | quit")
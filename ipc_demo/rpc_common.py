@@ -1,24 +1,66 @@
 import json
 import socket
 import struct
-from typing import Any
+from typing import Any, Iterable, Iterator
 
 HEADER_LEN = 4
+STREAM_FLAG = 0x80000000  # set in the header of raw stream chunks
+MAX_FRAME = STREAM_FLAG - 1
+STREAM_CHUNK = 1 << 20
 
 def send_msg(sock: socket.socket, obj: Any) -> None:
     data = json.dumps(obj, separators=(",", ":")).encode("utf-8")
     sock.sendall(struct.pack(">I", len(data)) + data)
 
-def recv_exact(sock: socket.socket, n: int) -> bytes:
-    buf = bytearray()
-    while len(buf) < n:
-        chunk = sock.recv(n - len(buf))
-        if not chunk:
+def recv_into_exact(sock: socket.socket, view: memoryview) -> None:
+    while view:
+        n = sock.recv_into(view)
+        if not n:
             raise ConnectionError("socket closed")
-        buf.extend(chunk)
-    return bytes(buf)
+        view = view[n:]
+
+def recv_exact(sock: socket.socket, n: int) -> bytearray:
+    # Preallocate once and fill in place; no per-chunk bytes objects or final copy.
+    buf = bytearray(n)
+    recv_into_exact(sock, memoryview(buf))
+    return buf
+
+def recv_header(sock: socket.socket) -> tuple:
+    """Returns (length, is_stream_chunk)."""
+    (word,) = struct.unpack(">I", recv_exact(sock, HEADER_LEN))
+    return word & MAX_FRAME, bool(word & STREAM_FLAG)
 
 def recv_msg(sock: socket.socket) -> Any:
-    (length,) = struct.unpack(">I", recv_exact(sock, HEADER_LEN))
-    payload = recv_exact(sock, length)
-    return json.loads(payload.decode("utf-8"))
+    length, streamed = recv_header(sock)
+    if streamed:
+        raise ValueError("unexpected stream chunk where a message was expected")
+    # The frame is read straight into one preallocated buffer, with no chunk list
+    # or concatenation. json.loads still decodes it to a str internally.
+    return json.loads(recv_exact(sock, length))
+
+# Chunked streams: a run of raw frames flagged with STREAM_FLAG, ended by an
+# empty flagged frame. Lets large payloads be produced/consumed incrementally.
+
+def send_stream(sock: socket.socket, chunks: Iterable[bytes], chunk_size: int = STREAM_CHUNK) -> None:
+    for chunk in chunks:
+        view = memoryview(chunk).cast("B")
+        for i in range(0, len(view), chunk_size):
+            part = view[i:i + chunk_size]
+            sock.sendall(struct.pack(">I", len(part) | STREAM_FLAG))
+            sock.sendall(part)
+    sock.sendall(struct.pack(">I", STREAM_FLAG))
+
+def recv_stream(sock: socket.socket) -> Iterator[memoryview]:
+    """Yields each chunk as a view into one reused buffer; a view is only valid until the next one."""
+    buf = bytearray(0)
+    while True:
+        length, streamed = recv_header(sock)
+        if not streamed:
+            raise ValueError("expected stream chunk")
+        if length == 0:
+            return
+        if len(buf) < length:
+            buf = bytearray(length)
+        view = memoryview(buf)[:length]
+        recv_into_exact(sock, view)
+        yield view
@@ -1,15 +1,102 @@
+import argparse
+import hashlib
+import ipaddress
+import os
 import socket
 import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime, timezone
-from rpc_common import send_msg, recv_msg
+from rpc_common import send_msg, recv_msg, recv_stream
+from rpc_transport import RING_SIZE, UNIX_PATH, ShmChannel, listen_unix, unix_supported
 
 HOST = "0.0.0.0"
 PORT = 13003
+MAX_BATCH = 1000  # upper bound on calls per batch frame
 
-print(f"RPC server on {HOST}:{PORT}")
+# Execution classes: where a registered function runs.
+#   inline  - on the connection's own thread (cheap calls)
+#   thread  - shared thread pool (blocking I/O)
+#   process - process pool, outside the GIL (CPU-heavy calls)
+# "limit" caps concurrent executions; "max_queue" caps calls waiting behind them.
+EXEC_LIMITS = {
+    "thread": {"limit": 16, "max_queue": 256},
+    "process": {"limit": os.cpu_count() or 2, "max_queue": 64},
+}
+
+
+class ExecClass:
+    def __init__(self, name, factory=None, limit=None, max_queue=None):
+        self.name = name
+        self.factory = factory
+        self.limit = limit
+        self.max_queue = max_queue
+        self.executor = None
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _pool(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = self.factory(self.limit)
+            return self.executor
+
+    def run(self, fn, args, kwargs):
+        with self.lock:
+            if self.max_queue is not None and self.in_flight >= self.limit + self.max_queue:
+                self.rejected += 1
+                raise RuntimeError(f"server busy ({self.name} queue full)")
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            if self.factory is None:
+                return fn(*args, **kwargs)
+            return self._pool().submit(fn, *args, **kwargs).result()
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+                self.completed += 1
+
+    def stats(self):
+        with self.lock:
+            queued = max(0, self.in_flight - self.limit) if self.limit else 0
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "queued": queued,
+                "peak_in_flight": self.peak_in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+EXEC_CLASSES = {
+    "inline": ExecClass("inline"),
+    "thread": ExecClass("thread", lambda n: ThreadPoolExecutor(max_workers=n, thread_name_prefix="rpc-exec"),
+                        **EXEC_LIMITS["thread"]),
+    "process": ExecClass("process", lambda n: ProcessPoolExecutor(max_workers=n), **EXEC_LIMITS["process"]),
+}
 
 # Function registry
 
+FUNCS = {}
+FUNC_CLASS = {}
+
+
+def register(name, fn, execution="inline"):
+    """Process-pool functions must be module-level so they can be pickled."""
+    if execution not in EXEC_CLASSES:
+        raise ValueError(f"unknown execution class: {execution}")
+    FUNCS[name] = fn
+    FUNC_CLASS[name] = execution
+
+
 def add(a, b):
     return a + b
 
@@ -22,46 +109,209 @@ def echo(x):
 def time_now():
     return datetime.now(timezone.utc).isoformat()
 
-FUNCS = {
-    "add": add,
-    "mul": mul,
-    "echo": echo,
-    "time": time_now,
+def count_primes(n):
+    # Deliberately CPU-bound trial division
+    n = int(n)
+    count = 0
+    for i in range(2, n):
+        r = int(i ** 0.5)
+        for d in range(2, r + 1):
+            if i % d == 0:
+                break
+        else:
+            count += 1
+    return count
+
+def exec_stats():
+    return {name: ec.stats() for name, ec in EXEC_CLASSES.items()}
+
+register("add", add)
+register("mul", mul)
+register("echo", echo)
+register("time", time_now)
+register("primes", count_primes, execution="process")
+register("stats", exec_stats)
+
+# Stream functions take an iterator of raw chunks instead of JSON args.
+# Request: {"call": name, "stream": true, "args": [...]} followed by a chunked stream.
+
+def sha256_stream(chunks):
+    h = hashlib.sha256()
+    total = 0
+    for chunk in chunks:
+        h.update(chunk)
+        total += len(chunk)
+    return {"sha256": h.hexdigest(), "bytes": total}
+
+STREAM_FUNCS = {
+    "sha256": sha256_stream,
 }
 
-srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-srv.bind((HOST, PORT))
-srv.listen(50)
+# Shared pool for batches sent with "parallel": true
+batch_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rpc-batch")
+
+
+def call_one(req):
+    if not isinstance(req, dict):
+        return {"ok": False, "error": "bad request", "data": None}
+    name = str(req.get("call", ""))
+    args = req.get("args", [])
+    kwargs = req.get("kwargs", {})
+    fn = FUNCS.get(name)
+    if not fn:
+        return {"ok": False, "error": f"unknown function: {name}", "data": None}
+    try:
+        res = EXEC_CLASSES[FUNC_CLASS[name]].run(fn, args, kwargs)
+        return {"ok": True, "data": res, "error": None}
+    except Exception as e:
+        return {"ok": False, "error": str(e), "data": None}
+
+
+def call_batch(req: dict):
+    """Run {"batch": [{call, args, kwargs}, ...], "parallel": bool}; results keep request order."""
+    calls = req.get("batch")
+    if not isinstance(calls, list):
+        return {"ok": False, "error": "bad batch", "data": None}
+    if len(calls) > MAX_BATCH:
+        return {"ok": False, "error": f"batch too large (max {MAX_BATCH})", "data": None}
+    if req.get("parallel") and len(calls) > 1:
+        results = list(batch_pool.map(call_one, calls))
+    else:
+        results = [call_one(c) for c in calls]
+    return {"ok": True, "data": results, "error": None}
+
+
+def call_stream(conn: socket.socket, req: dict):
+    chunks = recv_stream(conn)
+    fn = STREAM_FUNCS.get(str(req.get("call", "")))
+    try:
+        if not fn:
+            return {"ok": False, "error": f"unknown stream function: {req.get('call')}", "data": None}
+        try:
+            return {"ok": True, "data": fn(chunks, *req.get("args", []), **req.get("kwargs", {})), "error": None}
+        except Exception as e:
+            return {"ok": False, "error": str(e), "data": None}
+    finally:
+        for _ in chunks:  # drain whatever the function left so framing stays in sync
+            pass
+
+
+def dispatch(req):
+    if isinstance(req, dict) and "batch" in req:
+        return call_batch(req)
+    return call_one(req)
+
+
+def reject(chan, e: ValueError):
+    """Reply to a malformed frame (bad JSON, or a stream chunk where a message belongs); the caller then closes."""
+    try:
+        send_msg(chan, {"ok": False, "error": f"bad request: {e}", "data": None})
+    except OSError:
+        pass
+
+
+def serve(chan, req=None):
+    """Request loop over a socket or ShmChannel; req is an already-read first request."""
+    while True:
+        if req is None:
+            try:
+                req = recv_msg(chan)
+            except ConnectionError:
+                return
+            except ValueError as e:  # includes json.JSONDecodeError; framing can't be trusted after this
+                reject(chan, e)
+                return
+        if isinstance(req, dict) and req.get("stream"):
+            try:
+                reply = call_stream(chan, req)
+            except ValueError as e:  # an unflagged frame inside the stream
+                reject(chan, e)
+                return
+            send_msg(chan, reply)
+        else:
+            send_msg(chan, dispatch(req))
+        req = None
+
+
+def is_local_peer(conn: socket.socket) -> bool:
+    """AF_UNIX or loopback TCP: the only peers that may hand us a shared-memory segment."""
+    if conn.family not in (socket.AF_INET, socket.AF_INET6):
+        return True
+    try:
+        return ipaddress.ip_address(conn.getpeername()[0]).is_loopback
+    except (OSError, ValueError):
+        return False
 
 
 def handle(conn: socket.socket, addr):
     with conn:
         print("RPC connected:", addr)
         try:
-            while True:
+            try:
+                first = recv_msg(conn)
+            except ConnectionError:
+                return
+            except ValueError as e:
+                reject(conn, e)
+                return
+            if isinstance(first, dict) and first.get("transport") == "shm":
+                # Switch this client to shared-memory rings; conn stays open as the liveness channel.
+                if not is_local_peer(conn):
+                    send_msg(conn, {"ok": False, "error": "shm transport is only offered to local peers", "data": None})
+                    return
                 try:
-                    req = recv_msg(conn)
-                except ConnectionError:
-                    break
-                if not isinstance(req, dict):
-                    send_msg(conn, {"ok": False, "error": "bad request", "data": None})
-                    continue
-                name = str(req.get("call", ""))
-                args = req.get("args", [])
-                kwargs = req.get("kwargs", {})
-                fn = FUNCS.get(name)
-                if not fn:
-                    send_msg(conn, {"ok": False, "error": f"unknown function: {name}", "data": None})
-                    continue
-                try:
-                    res = fn(*args, **kwargs)
-                    send_msg(conn, {"ok": True, "data": res, "error": None})
+                    chan = ShmChannel.attach(str(first.get("name")), int(first.get("ring_size", RING_SIZE)),
+                                             control=conn)
                 except Exception as e:
-                    send_msg(conn, {"ok": False, "error": str(e), "data": None})
+                    send_msg(conn, {"ok": False, "error": f"shm attach failed: {e}", "data": None})
+                    return
+                send_msg(conn, {"ok": True, "data": "shm", "error": None})
+                try:
+                    serve(chan)
+                finally:
+                    chan.close()
+            else:
+                serve(conn, first)
         finally:
             print("RPC closed:", addr)
 
-while True:
-    c, a = srv.accept()
-    threading.Thread(target=handle, args=(c, a), daemon=True).start()
+
+def accept_loop(srv: socket.socket):
+    while True:
+        c, a = srv.accept()
+        threading.Thread(target=handle, args=(c, a or srv.getsockname()), daemon=True).start()
+
+
+def main():
+    # Kept under main() so process-pool workers can import this module safely.
+    ap = argparse.ArgumentParser(description="JSON RPC server")
+    ap.add_argument("--unix", nargs="?", const=UNIX_PATH, default=None, metavar="PATH",
+                    help=f"also listen on an AF_UNIX socket (default path {UNIX_PATH})")
+    args = ap.parse_args()
+    print(f"RPC server on {HOST}:{PORT}")
+    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    srv.bind((HOST, PORT))
+    srv.listen(50)
+    listeners = [srv]
+    if args.unix:
+        if not unix_supported():
+            raise SystemExit("AF_UNIX is not available on this platform")
+        listeners.append(listen_unix(args.unix))
+        print(f"RPC server on unix:{args.unix}")
+        threading.Thread(target=accept_loop, args=(listeners[-1],), daemon=True).start()
+    try:
+        accept_loop(srv)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for lst in listeners:
+            lst.close()
+        if args.unix and os.path.exists(args.unix):
+            os.unlink(args.unix)
+        for ec in EXEC_CLASSES.values():
+            ec.shutdown()
+
+
+if __name__ == "__main__":
+    main()
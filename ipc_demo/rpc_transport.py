@@ -0,0 +1,225 @@
+"""Same-host transports for the RPC demo.
+
+- AF_UNIX stream sockets: a drop-in socket, just without the TCP/IP stack.
+- Shared-memory rings: ShmChannel exposes sendall/recv_into, so the
+  rpc_common framing (send_msg/recv_msg/streams) runs on it unchanged.
+
+A shm session is negotiated on an ordinary connection: the client creates the
+segment and sends {"transport": "shm", "name": ...} as its first message. The
+server attaches and then serves that client over the rings. The control
+socket stays open so that either side notices when the other one goes away.
+The server only accepts this handshake from loopback or AF_UNIX peers, and
+attach() only opens rpc_* segments of the size the ring needs.
+"""
+import os
+import re
+import select
+import socket
+import struct
+import tempfile
+import time
+import uuid
+from multiprocessing import shared_memory
+
+UNIX_PATH = os.path.join(tempfile.gettempdir(), "ipc_demo_rpc.sock")
+RING_SIZE = 1 << 20
+MAX_RING_SIZE = 64 << 20
+SHM_PREFIX = "rpc_"
+SHM_NAME = re.compile(r"rpc_[0-9a-f]{16}")  # what ShmChannel.create generates
+# Busy polls before backing off to short sleeps. Spinning only pays off when the
+# peer can run on another core; on one core it just delays the peer.
+SPIN = 2000 if (os.cpu_count() or 1) > 1 else 0
+YIELDS = 200           # polls that give up the CPU without a timer delay, before real sleeps
+_yield = getattr(os, "sched_yield", lambda: time.sleep(0))
+IDLE_SLEEP = 50e-6     # first sleep once idle; doubles on each empty poll...
+IDLE_SLEEP_MAX = 5e-3  # ...up to this, so an idle session wakes ~200 times/s, not ~20k
+LIVENESS_EVERY = 0.1   # seconds between control-socket checks while idle
+
+# Per ring: head (bytes written, producer only), tail (bytes read, consumer only)
+RING_HDR = struct.Struct("<QQ")
+RING_HDR_SIZE = 64
+CLOSED_OFF = 0  # one byte at the start of the segment: set by whichever side closes
+SEG_HDR_SIZE = 64
+
+
+def unix_supported() -> bool:
+    return hasattr(socket, "AF_UNIX")
+
+
+def listen_unix(path: str = UNIX_PATH, backlog: int = 50) -> socket.socket:
+    if os.path.exists(path):
+        os.unlink(path)  # stale socket file from a previous run
+    srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    srv.bind(path)
+    srv.listen(backlog)
+    return srv
+
+
+def connect_unix(path: str = UNIX_PATH, timeout: float = 5) -> socket.socket:
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.settimeout(timeout)
+    s.connect(path)
+    return s
+
+
+class _Ring:
+    """Single-producer/single-consumer byte ring over a slice of shared memory."""
+
+    def __init__(self, buf: memoryview, capacity: int):
+        self.hdr = buf[:RING_HDR_SIZE]
+        self.data = buf[RING_HDR_SIZE:RING_HDR_SIZE + capacity]
+        self.capacity = capacity
+
+    def counters(self):
+        return RING_HDR.unpack_from(self.hdr, 0)
+
+    def write_some(self, view: memoryview) -> int:
+        head, tail = self.counters()
+        n = min(self.capacity - (head - tail), len(view))
+        if n <= 0:
+            return 0
+        pos = head % self.capacity
+        first = min(n, self.capacity - pos)
+        self.data[pos:pos + first] = view[:first]
+        if n > first:
+            self.data[:n - first] = view[first:n]
+        struct.pack_into("<Q", self.hdr, 0, head + n)  # publish after the bytes are in place
+        return n
+
+    def read_some(self, view: memoryview) -> int:
+        head, tail = self.counters()
+        n = min(head - tail, len(view))
+        if n <= 0:
+            return 0
+        pos = tail % self.capacity
+        first = min(n, self.capacity - pos)
+        view[:first] = self.data[pos:pos + first]
+        if n > first:
+            view[first:n] = self.data[:n - first]
+        struct.pack_into("<Q", self.hdr, 8, tail + n)
+        return n
+
+
+class ShmChannel:
+    """Full-duplex byte channel over two shared-memory rings (client->server, server->client)."""
+
+    def __init__(self, shm: shared_memory.SharedMemory, is_server: bool, owner: bool,
+                 ring_size: int = RING_SIZE, control: socket.socket = None, timeout: float = None):
+        self.shm = shm
+        self.owner = owner
+        self.control = control
+        self.timeout = timeout
+        buf = shm.buf
+        span = RING_HDR_SIZE + ring_size
+        c2s = _Ring(buf[SEG_HDR_SIZE:SEG_HDR_SIZE + span], ring_size)
+        s2c = _Ring(buf[SEG_HDR_SIZE + span:SEG_HDR_SIZE + 2 * span], ring_size)
+        self.tx, self.rx = (s2c, c2s) if is_server else (c2s, s2c)
+        self.buf = buf
+        self.name = shm.name
+
+    @staticmethod
+    def segment_size(ring_size: int) -> int:
+        return SEG_HDR_SIZE + 2 * (RING_HDR_SIZE + ring_size)
+
+    @classmethod
+    def create(cls, ring_size: int = RING_SIZE, **kw) -> "ShmChannel":
+        # New segments are zero-filled, so both rings start empty and the closed flag is clear.
+        shm = shared_memory.SharedMemory(name=f"{SHM_PREFIX}{uuid.uuid4().hex[:16]}", create=True,
+                                         size=cls.segment_size(ring_size))
+        return cls(shm, is_server=False, owner=True, ring_size=ring_size, **kw)
+
+    @classmethod
+    def attach(cls, name: str, ring_size: int = RING_SIZE, **kw) -> "ShmChannel":
+        """Server side. Refuses names create() wouldn't produce and segments too small for the rings."""
+        if not SHM_NAME.fullmatch(name):
+            raise ValueError(f"not an RPC segment name: {name!r}")
+        if not 0 < ring_size <= MAX_RING_SIZE:
+            raise ValueError(f"ring_size must be in 1..{MAX_RING_SIZE}")
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=name)
+            try:  # the client owns the segment; don't let our tracker unlink it
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(shm._name, "shared_memory")
+            except Exception:
+                pass
+        if shm.size < cls.segment_size(ring_size):
+            shm.close()
+            raise ValueError(f"segment {name} is {shm.size} bytes, rings need {cls.segment_size(ring_size)}")
+        return cls(shm, is_server=True, owner=False, ring_size=ring_size, **kw)
+
+    def closed(self) -> bool:
+        return self.buf is None or self.buf[CLOSED_OFF] != 0
+
+    def _peer_gone(self) -> bool:
+        if self.control is None:
+            return False
+        try:
+            readable, _, _ = select.select([self.control], [], [], 0)
+            # The control socket carries no data after the handshake: readable means EOF or reset.
+            return bool(readable) and self.control.recv(1, socket.MSG_PEEK) == b""
+        except OSError:
+            return True
+
+    def _wait(self, step):
+        """Run step() until it moves bytes: spin first for latency, then back off.
+
+        Sleeps grow from IDLE_SLEEP to IDLE_SLEEP_MAX while nothing arrives;
+        each call starts again from the spin, so the backoff resets with data.
+        """
+        for _ in range(SPIN):
+            n = step()
+            if n:
+                return n
+            if self.closed():
+                return step()  # pick up anything written just before the close
+        for _ in range(YIELDS):
+            _yield()
+            n = step()
+            if n:
+                return n
+            if self.closed():
+                return step()
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+        next_check = time.monotonic() + LIVENESS_EVERY
+        pause = IDLE_SLEEP
+        while True:
+            n = step()
+            if n:
+                return n
+            if self.closed():
+                return step()
+            time.sleep(pause)
+            pause = min(pause * 2, IDLE_SLEEP_MAX)
+            now = time.monotonic()
+            if deadline is not None and now > deadline:
+                raise socket.timeout("shm channel timed out")
+            if now > next_check:
+                if self._peer_gone():
+                    return 0
+                next_check = now + LIVENESS_EVERY
+
+    def sendall(self, data) -> None:
+        view = memoryview(data).cast("B")
+        while view:
+            n = self._wait(lambda: self.tx.write_some(view))
+            if not n:
+                raise ConnectionError("shm channel closed")
+            view = view[n:]
+
+    def recv_into(self, view: memoryview) -> int:
+        # Returns 0 (EOF, like a socket) once the peer has closed and the ring is drained.
+        return self._wait(lambda: self.rx.read_some(view))
+
+    def close(self) -> None:
+        if self.buf is None:
+            return
+        self.buf[CLOSED_OFF] = 1
+        self.tx = self.rx = None
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        if self.control is not None:
+            self.control.close()
@@ -1,30 +1,166 @@
+import argparse
+import asyncio
+import os
+import selectors
 import socket
 import threading
 
 HOST = "0.0.0.0"
 PORT = 13000
+PREFIX = b"echo: "
+BUF_SIZE = 4096
 
-print(f"TCP echo server on {HOST}:{PORT}")
 
-srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-srv.bind((HOST, PORT))
-srv.listen(50)
+def make_listener(reuse_port: bool = False) -> socket.socket:
+    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    srv.bind((HOST, PORT))
+    srv.listen(1024)
+    return srv
 
 
+# --- thread mode (original): one thread per connection ---
+
 def handle(conn: socket.socket, addr):
     with conn:
         print("TCP connected:", addr)
         try:
             while True:
-                data = conn.recv(4096)
+                data = conn.recv(BUF_SIZE)
                 if not data:
                     break
-                conn.sendall(b"echo: " + data)
+                conn.sendall(PREFIX + data)
         finally:
             print("TCP closed:", addr)
 
 
-while True:
-    c, a = srv.accept()
-    threading.Thread(target=handle, args=(c, a), daemon=True).start()
+def serve_threads(srv: socket.socket):
+    while True:
+        c, a = srv.accept()
+        threading.Thread(target=handle, args=(c, a), daemon=True).start()
+
+
+# --- selectors mode: single-threaded epoll/kqueue/select loop ---
+
+def send_parts(conn: socket.socket, parts) -> int:
+    # Gather write: prefix and payload leave in one syscall without concatenating.
+    if hasattr(conn, "sendmsg"):
+        return conn.sendmsg(parts)
+    return conn.send(b"".join(parts))
+
+
+def serve_selectors(srv: socket.socket):
+    sel = selectors.DefaultSelector()
+    srv.setblocking(False)
+    sel.register(srv, selectors.EVENT_READ, None)
+    buf = bytearray(BUF_SIZE)  # shared read buffer; data is echoed before the next read
+    view = memoryview(buf)
+    pending = {}  # conn -> unsent bytes (only when the peer is slow to read)
+
+    def close(conn):
+        sel.unregister(conn)
+        pending.pop(conn, None)
+        conn.close()
+
+    while True:
+        for key, events in sel.select():
+            conn = key.fileobj
+            if key.data is None:
+                try:
+                    c, _ = conn.accept()
+                except BlockingIOError:
+                    continue
+                c.setblocking(False)
+                sel.register(c, selectors.EVENT_READ, "conn")
+                continue
+            try:
+                if events & selectors.EVENT_WRITE:
+                    rest = pending[conn]
+                    sent = conn.send(rest)
+                    if sent < len(rest):
+                        pending[conn] = rest[sent:]
+                    else:
+                        del pending[conn]
+                        sel.modify(conn, selectors.EVENT_READ, "conn")
+                    continue
+                n = conn.recv_into(view)
+                if not n:
+                    close(conn)
+                    continue
+                total = len(PREFIX) + n
+                try:
+                    sent = send_parts(conn, [PREFIX, view[:n]])
+                except (BlockingIOError, InterruptedError):
+                    sent = 0  # peer's buffer is full; the bytes just read must still be echoed
+                if sent < total:
+                    # Stop reading from this peer until its backlog drains
+                    pending[conn] = (PREFIX + bytes(view[:n]))[sent:]
+                    sel.modify(conn, selectors.EVENT_WRITE, "conn")
+            except (BlockingIOError, InterruptedError):
+                continue
+            except OSError:
+                close(conn)
+
+
+# --- asyncio mode ---
+
+class EchoProtocol(asyncio.Protocol):
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.transport.writelines((PREFIX, data))
+
+
+def serve_asyncio(srv: socket.socket):
+    async def run():
+        loop = asyncio.get_running_loop()
+        server = await loop.create_server(EchoProtocol, sock=srv)
+        async with server:
+            await server.serve_forever()
+    asyncio.run(run())
+
+
+MODES = {"thread": serve_threads, "selectors": serve_selectors, "asyncio": serve_asyncio}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="TCP echo server")
+    ap.add_argument("--mode", choices=sorted(MODES), default="thread")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="fork N processes sharing the port via SO_REUSEPORT (Linux/BSD)")
+    args = ap.parse_args()
+
+    print(f"TCP echo server on {HOST}:{PORT} (mode={args.mode}, workers={args.workers})")
+    serve = MODES[args.mode]
+    if args.workers <= 1:
+        try:
+            serve(make_listener())
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if not hasattr(socket, "SO_REUSEPORT") or not hasattr(os, "fork"):
+        raise SystemExit("--workers needs SO_REUSEPORT and fork (not available on this platform)")
+    children = []
+    for _ in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            # Each worker has its own listening socket; the kernel balances accepts.
+            try:
+                serve(make_listener(reuse_port=True))
+            except KeyboardInterrupt:
+                pass
+            os._exit(0)
+        children.append(pid)
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,86 @@
+import argparse
 import socket
 import sys
+import threading
+import time
 
 HOST = "127.0.0.1"
 PORT = 13001
 
-print(f"Send UDP to {HOST}:{PORT} (type lines, Ctrl+C to exit)")
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-try:
-    while True:
-        try:
-            line = input(">> ")
-        except (EOFError, KeyboardInterrupt):
-            break
-        if not line:
-            continue
-        sock.sendto(line.encode("utf-8"), (HOST, PORT))
-        data, _ = sock.recvfrom(65535)
-        print(data.decode("utf-8"))
-finally:
-    sock.close()
+
+def interactive():
+    print(f"Send UDP to {HOST}:{PORT} (type lines, Ctrl+C to exit)")
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        while True:
+            try:
+                line = input(">> ")
+            except (EOFError, KeyboardInterrupt):
+                break
+            if not line:
+                continue
+            sock.sendto(line.encode("utf-8"), (HOST, PORT))
+            data, _ = sock.recvfrom(65535)
+            print(data.decode("utf-8"))
+    finally:
+        sock.close()
+
+
+def flood(count: int, size: int, window: int, sockets: int):
+    """Blast `count` datagrams with at most `window` unanswered per socket; report pps and loss."""
+    payload = b"x" * size
+    per_sock = count // sockets
+    received = [0] * sockets
+    done = threading.Event()
+
+    def run(i):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.connect((HOST, PORT))  # connected UDP: plain send/recv, source port fixed per socket
+        credits = threading.Semaphore(window)
+
+        def reader():
+            buf = bytearray(65535)
+            sock.settimeout(0.2)
+            while not done.is_set():
+                try:
+                    sock.recv_into(buf)
+                except socket.timeout:
+                    continue
+                except OSError:
+                    return
+                received[i] += 1
+                credits.release()
+
+        threading.Thread(target=reader, daemon=True).start()
+        for _ in range(per_sock):
+            credits.acquire(timeout=0.05)  # on timeout treat the oldest packet as lost
+            sock.send(payload)
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(sockets)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    sent = per_sock * sockets
+    deadline = time.perf_counter() + 1.0
+    while sum(received) < sent and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - t0
+    done.set()
+    got = sum(received)
+    print(f"sent={sent} received={got} lost={sent - got} ({100.0 * (sent - got) / max(sent, 1):.2f}%)")
+    print(f"elapsed={elapsed:.3f}s  {got / elapsed:,.0f} replies/s  size={size}B window={window} sockets={sockets}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="UDP echo client")
+    ap.add_argument("--flood", type=int, default=0, metavar="N", help="benchmark: send N datagrams and exit")
+    ap.add_argument("--size", type=int, default=64)
+    ap.add_argument("--window", type=int, default=64, help="max unanswered datagrams per socket")
+    ap.add_argument("--sockets", type=int, default=1, help="parallel client sockets (spreads across --workers)")
+    args = ap.parse_args()
+    if args.flood:
+        flood(args.flood, args.size, args.window, args.sockets)
+        sys.exit(0)
+    interactive()
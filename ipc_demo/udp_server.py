@@ -1,14 +1,131 @@
+import argparse
+import asyncio
+import os
+import random
 import socket
+import threading
+import time
 
 HOST = "0.0.0.0"
 PORT = 13001
+PREFIX = b"echo: "
+MAX_DGRAM = 65535
 
-print(f"UDP echo server on {HOST}:{PORT}")
 
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.bind((HOST, PORT))
+class Stats:
+    """Packet counter; a daemon thread prints packets/sec once per interval."""
 
-while True:
-    data, addr = sock.recvfrom(65535)
-    print("UDP from", addr, data)
-    sock.sendto(b"echo: " + data, addr)
+    def __init__(self, interval: float = 0.0):
+        self.packets = 0
+        self.interval = interval
+
+    def start(self):
+        if self.interval > 0:
+            threading.Thread(target=self._report, daemon=True).start()
+
+    def _report(self):
+        last, t0 = 0, time.perf_counter()
+        while True:
+            time.sleep(self.interval)
+            now, count = time.perf_counter(), self.packets
+            print(f"[{os.getpid()}] {(count - last) / (now - t0):,.0f} packets/s (total {count:,})", flush=True)
+            last, t0 = count, now
+
+
+def should_log(level: str, sample: float) -> bool:
+    if level == "all":
+        return True
+    return level == "sample" and random.random() < sample
+
+
+def make_socket(reuse_port: bool = False) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+    sock.bind((HOST, PORT))
+    return sock
+
+
+def serve_loop(sock: socket.socket, stats: Stats, log: str, sample: float):
+    # One preallocated buffer: the prefix sits in front and each datagram is
+    # received right after it, so the reply is a slice of the same memory.
+    buf = bytearray(len(PREFIX) + MAX_DGRAM)
+    buf[:len(PREFIX)] = PREFIX
+    view = memoryview(buf)
+    body = view[len(PREFIX):]
+    while True:
+        n, addr = sock.recvfrom_into(body)
+        stats.packets += 1
+        if log != "off" and should_log(log, sample):
+            print("UDP from", addr, bytes(body[:n]))
+        sock.sendto(view[:len(PREFIX) + n], addr)
+
+
+class EchoDatagram(asyncio.DatagramProtocol):
+    def __init__(self, stats: Stats, log: str, sample: float):
+        self.stats, self.log, self.sample = stats, log, sample
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.stats.packets += 1
+        if self.log != "off" and should_log(self.log, self.sample):
+            print("UDP from", addr, data)
+        self.transport.sendto(PREFIX + data, addr)
+
+
+def serve_asyncio(sock: socket.socket, stats: Stats, log: str, sample: float):
+    async def run():
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: EchoDatagram(stats, log, sample), sock=sock)
+        await asyncio.Event().wait()
+    asyncio.run(run())
+
+
+MODES = {"loop": serve_loop, "asyncio": serve_asyncio}
+
+
+def run_worker(args, reuse_port: bool):
+    stats = Stats(args.stats_interval)
+    stats.start()
+    try:
+        MODES[args.mode](make_socket(reuse_port), stats, args.log, args.sample)
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    ap = argparse.ArgumentParser(description="UDP echo server")
+    ap.add_argument("--mode", choices=sorted(MODES), default="loop")
+    ap.add_argument("--log", choices=["all", "sample", "off"], default="all",
+                    help="per-packet logging; use off or sample for benchmarks")
+    ap.add_argument("--sample", type=float, default=0.001, help="fraction of packets logged with --log sample")
+    ap.add_argument("--stats-interval", type=float, default=0.0, help="print packets/sec every N seconds")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="fork N processes sharing the port via SO_REUSEPORT (Linux/BSD)")
+    args = ap.parse_args()
+
+    print(f"UDP echo server on {HOST}:{PORT} (mode={args.mode}, workers={args.workers}, log={args.log})")
+    if args.workers <= 1:
+        run_worker(args, reuse_port=False)
+        return
+    if not hasattr(socket, "SO_REUSEPORT") or not hasattr(os, "fork"):
+        raise SystemExit("--workers needs SO_REUSEPORT and fork (not available on this platform)")
+    children = []
+    for _ in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            run_worker(args, reuse_port=True)
+            os._exit(0)
+        children.append(pid)
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()